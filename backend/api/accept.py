@@ -0,0 +1,42 @@
+from fastapi import Request
+
+JSON_MEDIA_TYPE = "application/json"
+
+
+def accept_qualities(request: Request) -> dict[str, float]:
+    qualities: dict[str, float] = {}
+    for media_range in request.headers.get("accept", "").split(","):
+        media_type, *parameters = media_range.split(";")
+        media_type = media_type.strip().lower()
+        if media_type == "" or media_type in qualities:
+            continue
+        quality = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = min(max(float(value), 0.0), 1.0)
+                except ValueError:
+                    quality = 0.0
+        qualities[media_type] = quality
+    return qualities
+
+
+def quality(qualities: dict[str, float], media_type: str) -> float:
+    # The most specific range decides, a missing header accepts everything
+    if len(qualities) == 0:
+        return 1.0
+    for media_range in (media_type, media_type.split("/")[0] + "/*", "*/*"):
+        if media_range in qualities:
+            return qualities[media_range]
+    return 0.0
+
+
+def preferred_quality(request: Request, media_type: str) -> float:
+    # Other formats than JSON have to be asked for by name, wildcards mean JSON,
+    # and they win a tie with JSON because naming them is the more specific wish
+    qualities = accept_qualities(request)
+    explicit = qualities.get(media_type, 0.0)
+    if explicit <= 0.0 or explicit < quality(qualities, JSON_MEDIA_TYPE):
+        return 0.0
+    return explicit
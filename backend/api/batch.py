@@ -0,0 +1,106 @@
+import asyncio
+from collections.abc import Sequence
+from typing import Any
+from urllib.parse import urlsplit
+from fastapi import Request
+from starlette.types import ASGIApp, Message
+import pydantic_core
+
+# Headers a client needs to continue a paged read or revalidate a result
+FORWARDED_HEADERS = {b"link": "link", b"etag": "etag"}
+
+
+def sub_scope(request: Request, path: str) -> dict[str, Any]:
+    url = urlsplit(path)
+    headers = [
+        (name, value)
+        for name, value in request.scope["headers"]
+        if name in (b"host", b"authorization", b"cookie")
+    ]
+    # Sub-responses are spliced into one JSON document
+    headers.append((b"accept", b"application/json"))
+    return {
+        "type": "http",
+        "asgi": request.scope.get("asgi", {"version": "3.0"}),
+        "http_version": request.scope.get("http_version", "1.1"),
+        "method": "GET",
+        "scheme": request.scope["scheme"],
+        "server": request.scope.get("server"),
+        "client": request.scope.get("client"),
+        "root_path": request.scope.get("root_path", ""),
+        "path": url.path,
+        "raw_path": url.path.encode(),
+        "query_string": url.query.encode(),
+        "headers": headers,
+        "state": dict(request.scope.get("state", {})),
+    }
+
+
+async def run_request(app: ASGIApp, request: Request, path: str) -> dict[str, Any]:
+    status = 500
+    content_type = ""
+    headers: dict[str, str] = {}
+    body = bytearray()
+    received = False
+    finished = asyncio.Event()
+
+    async def receive() -> Message:
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Streaming responses listen for a disconnect until they are done
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: Message) -> None:
+        nonlocal status, content_type
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            for name, value in message.get("headers", []):
+                name = name.lower()
+                if name == b"content-type":
+                    content_type = value.decode("latin-1")
+                elif name in FORWARDED_HEADERS:
+                    headers[FORWARDED_HEADERS[name]] = value.decode("latin-1")
+        elif message["type"] == "http.response.body":
+            body.extend(message.get("body", b""))
+            if not message.get("more_body", False):
+                finished.set()
+
+    scope = sub_scope(request, path)
+    try:
+        await app(scope, receive, send)
+    except Exception:
+        # The error middleware has already logged it and sent a 500
+        status = 500
+    finally:
+        finished.set()
+    return {
+        "path": path,
+        "status": status,
+        "headers": headers,
+        "content_type": content_type,
+        "body": bytes(body),
+    }
+
+
+def encode_results(results: Sequence[dict[str, Any]]) -> bytes:
+    # JSON bodies are copied as they are instead of being parsed and encoded again
+    parts = []
+    for result in results:
+        body = result["body"]
+        if not result["content_type"].startswith("application/json"):
+            body = pydantic_core.to_json(body.decode("utf-8", "replace"))
+        elif len(body) == 0:
+            body = b"null"
+        parts.append(
+            b'{"path":%s,"status":%d,"headers":%s,"body":%s}'
+            % (
+                pydantic_core.to_json(result["path"]),
+                result["status"],
+                pydantic_core.to_json(result["headers"]),
+                body,
+            )
+        )
+    return b"[" + b",".join(parts) + b"]"
@@ -0,0 +1,118 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+import pydantic as pdt
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+
+try:  # Production
+    from .columnar import accepts_columnar
+    from .stream import accepts_ndjson
+    from .version import DatasetVersions
+except ImportError:  # Development
+    from columnar import accepts_columnar
+    from stream import accepts_ndjson
+    from version import DatasetVersions
+
+
+def request_key(endpoint: Callable, request: Request, arguments: dict) -> Hashable:
+    # Absolute links in the body depend on the base url, formats on Accept
+    parameters = tuple(
+        sorted(
+            (
+                name,
+                (
+                    value.model_dump_json()
+                    if isinstance(value, pdt.BaseModel)
+                    else value
+                ),
+            )
+            for name, value in arguments.items()
+            if not isinstance(value, (Request, Response))
+        )
+    )
+    return (
+        endpoint.__name__,
+        str(request.base_url),
+        accepts_columnar(request),
+        accepts_ndjson(request),
+        parameters,
+    )
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        versions: DatasetVersions,
+        max_size: int,
+        ttl: float,
+        max_body_size: int,
+        max_bytes: int,
+    ) -> None:
+        self.versions = versions
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_body_size = max_body_size
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries: OrderedDict[Hashable, tuple[float, Response]] = OrderedDict()
+        self.version: Hashable = None
+        self.lock = threading.Lock()
+
+    async def get(self, key: Hashable) -> Response | None:
+        version = tuple(sorted((await self.versions.current()).items()))
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.size = 0
+                self.version = version
+                return None
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, response = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                self.size -= len(response.body)
+                return None
+            self.entries.move_to_end(key)
+            return response
+
+    def set(self, key: Hashable, response: Response, version: Hashable) -> None:
+        if isinstance(response, StreamingResponse):
+            return
+        size = len(response.body)
+        if size > self.max_body_size or size > self.max_bytes:
+            return
+        with self.lock:
+            if version != self.version:
+                # The dataset changed while the response was being built
+                return
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous[1].body)
+            self.entries[key] = (time.monotonic() + self.ttl, response)
+            self.size += size
+            while len(self.entries) > self.max_size or self.size > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= len(evicted.body)
+
+    def __call__(
+        self, endpoint: Callable[..., Awaitable[Response]]
+    ) -> Callable[..., Awaitable[Response]]:
+        if self.max_size <= 0 or self.max_bytes <= 0:
+            return endpoint
+
+        @functools.wraps(endpoint)
+        async def cached_endpoint(**arguments) -> Response:
+            key = request_key(endpoint, arguments["request"], arguments)
+            response = await self.get(key)
+            if response is None:
+                version = self.version
+                response = await endpoint(**arguments)
+                self.set(key, response, version)
+            return response
+
+        return cached_endpoint
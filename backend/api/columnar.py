@@ -0,0 +1,58 @@
+from collections.abc import Sequence
+from fastapi import HTTPException, Request
+import sqlalchemy as sql
+import sqlalchemy.orm as orm
+
+try:  # Production
+    from .accept import preferred_quality
+    from .stream import NDJSON_MEDIA_TYPE
+except ImportError:  # Development
+    from accept import preferred_quality
+    from stream import NDJSON_MEDIA_TYPE
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+
+
+def accepts_columnar(request: Request) -> str | None:
+    qualities = {
+        media_type: preferred_quality(request, media_type)
+        for media_type in (ARROW_MEDIA_TYPE, PARQUET_MEDIA_TYPE)
+    }
+    # Ties go to Arrow, and to columnar output over NDJSON
+    media_type = max(qualities, key=qualities.get)
+    quality = qualities[media_type]
+    if quality <= 0.0 or quality < preferred_quality(request, NDJSON_MEDIA_TYPE):
+        return None
+    return media_type
+
+
+def encode_columnar(
+    rows: Sequence[sql.Row],
+    columns: Sequence[orm.InstrumentedAttribute],
+    media_type: str,
+) -> bytes:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise HTTPException(
+            status_code=406, detail="Columnar output is not available on this server"
+        )
+    arrow_types = {int: pa.int32(), float: pa.float64(), str: pa.string()}
+    values = list(zip(*rows)) if len(rows) > 0 else [() for _ in columns]
+    table = pa.table(
+        {
+            column.key: pa.array(
+                column_values, type=arrow_types[column.type.python_type]
+            )
+            for column, column_values in zip(columns, values)
+        }
+    )
+    sink = pa.BufferOutputStream()
+    if media_type == ARROW_MEDIA_TYPE:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pq.write_table(table, sink)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,83 @@
+import datetime
+import functools
+import hashlib
+from collections.abc import Awaitable, Callable
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import Request, Response
+import db
+
+try:  # Production
+    from .cache import request_key
+    from .version import DatasetVersions
+except ImportError:  # Development
+    from cache import request_key
+    from version import DatasetVersions
+
+
+def not_modified(request: Request, etag: str, last_modified: datetime.datetime) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        return False
+    return last_modified.replace(microsecond=0) <= since
+
+
+class ConditionalGet:
+    def __init__(self, versions: DatasetVersions) -> None:
+        self.versions = versions
+
+    def __call__(
+        self, *models: type[db.Base]
+    ) -> Callable[
+        [Callable[..., Awaitable[Response]]], Callable[..., Awaitable[Response]]
+    ]:
+        tables = [model.__tablename__ for model in models]
+
+        def decorator(
+            endpoint: Callable[..., Awaitable[Response]],
+        ) -> Callable[..., Awaitable[Response]]:
+            @functools.wraps(endpoint)
+            async def conditional_endpoint(**arguments) -> Response:
+                request = arguments["request"]
+                versions = await self.versions.current()
+                if any(table not in versions for table in tables):
+                    response = await endpoint(**arguments)
+                    response.headers["Vary"] = "Accept"
+                    return response
+                table_versions = [versions[table] for table in tables]
+                digest = hashlib.blake2b(
+                    repr(
+                        (request_key(endpoint, request, arguments), table_versions)
+                    ).encode(),
+                    digest_size=16,
+                )
+                etag = f'"{digest.hexdigest()}"'
+                last_modified = max(
+                    modified_at for _, modified_at in table_versions
+                ).astimezone(datetime.timezone.utc)
+                headers = {
+                    "ETag": etag,
+                    "Last-Modified": format_datetime(last_modified, usegmt=True),
+                    # Clients revalidate every time, which costs no query when unchanged
+                    "Cache-Control": "no-cache",
+                    # JSON, NDJSON and columnar bodies share the same URL
+                    "Vary": "Accept",
+                }
+                if not_modified(request, etag, last_modified):
+                    return Response(status_code=304, headers=headers)
+                response = await endpoint(**arguments)
+                response.headers.update(headers)
+                return response
+
+            return conditional_endpoint
+
+        return decorator
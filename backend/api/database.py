@@ -0,0 +1,182 @@
+import contextlib
+import contextvars
+import time
+from collections.abc import AsyncIterator, Iterator, Sequence
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
+import sqlalchemy as sql
+import sqlalchemy.ext.asyncio as sql_async
+import db
+
+try:  # Production
+    from .pool import PoolMetrics
+    from .settings import (
+        DATABASE_DRIVER,
+        POOL_MAX_OVERFLOW,
+        POOL_PRE_PING,
+        POOL_RECYCLE,
+        POOL_SIZE,
+        POOL_TIMEOUT,
+        WORKERS,
+    )
+    from .stream import STREAM_BATCH_SIZE
+except ImportError:  # Development
+    from pool import PoolMetrics
+    from settings import (
+        DATABASE_DRIVER,
+        POOL_MAX_OVERFLOW,
+        POOL_PRE_PING,
+        POOL_RECYCLE,
+        POOL_SIZE,
+        POOL_TIMEOUT,
+        WORKERS,
+    )
+    from stream import STREAM_BATCH_SIZE
+
+
+def database_url(driver: str) -> str:
+    return f"postgresql+{driver}://\
+{db.USERNAME}:{db.PASSWORD}@\
+{db.CONTAINER_HOST}:{db.CONTAINER_PORT}/\
+{db.DATABASE_NAME}"
+
+
+POOL_OPTIONS = dict(
+    pool_size=POOL_SIZE,
+    max_overflow=POOL_MAX_OVERFLOW,
+    pool_timeout=POOL_TIMEOUT,
+    pool_recycle=POOL_RECYCLE,
+    pool_pre_ping=POOL_PRE_PING,
+)
+
+if DATABASE_DRIVER == "asyncpg":
+    async_engine = sql_async.create_async_engine(
+        database_url("asyncpg"), **POOL_OPTIONS
+    )
+    engine = None
+    pool_metrics = PoolMetrics(async_engine.pool, POOL_MAX_OVERFLOW, WORKERS)
+elif DATABASE_DRIVER == "psycopg2":
+    # Blocking queries run in the threadpool instead
+    async_engine = None
+    engine = sql.create_engine(database_url("psycopg2"), **POOL_OPTIONS)
+    pool_metrics = PoolMetrics(engine.pool, POOL_MAX_OVERFLOW, WORKERS)
+else:
+    raise ValueError(f"Unsupported database driver: {DATABASE_DRIVER}")
+
+
+# Every query of a batch reads the database as of the same moment
+SNAPSHOT_OPTIONS = dict(isolation_level="REPEATABLE READ", postgresql_readonly=True)
+
+snapshot_connection: contextvars.ContextVar[
+    sql.Connection | sql_async.AsyncConnection | None
+] = contextvars.ContextVar("snapshot_connection", default=None)
+
+
+@contextlib.contextmanager
+def connect_sync(**options) -> Iterator[sql.Connection]:
+    start = time.perf_counter()
+    try:
+        connection = engine.connect()
+    except sql.exc.TimeoutError:
+        pool_metrics.timed_out()
+        raise
+    pool_metrics.waited(time.perf_counter() - start)
+    with connection:
+        connection.execution_options(**options)
+        with connection.begin():
+            yield connection
+
+
+@contextlib.asynccontextmanager
+async def connect(**options) -> AsyncIterator[sql_async.AsyncConnection]:
+    start = time.perf_counter()
+    connection = async_engine.connect()
+    try:
+        await connection.start()
+    except sql.exc.TimeoutError:
+        pool_metrics.timed_out()
+        raise
+    pool_metrics.waited(time.perf_counter() - start)
+    try:
+        await connection.execution_options(**options)
+        async with connection.begin():
+            yield connection
+    finally:
+        await connection.close()
+
+
+@contextlib.asynccontextmanager
+async def snapshot_transaction() -> AsyncIterator[None]:
+    if async_engine is None:
+        context = connect_sync(**SNAPSHOT_OPTIONS)
+        connection = await run_in_threadpool(context.__enter__)
+        token = snapshot_connection.set(connection)
+        try:
+            yield
+        finally:
+            snapshot_connection.reset(token)
+            await run_in_threadpool(context.__exit__, None, None, None)
+        return
+    async with connect(**SNAPSHOT_OPTIONS) as connection:
+        token = snapshot_connection.set(connection)
+        try:
+            yield
+        finally:
+            snapshot_connection.reset(token)
+
+
+def fetch_all_sync(
+    statement: sql.Executable, connection: sql.Connection | None = None
+) -> Sequence[sql.Row]:
+    if connection is not None:
+        with connection.begin_nested():
+            return connection.execute(statement).all()
+    with connect_sync() as connection:
+        return connection.execute(statement).all()
+
+
+async def fetch_all(statement: sql.Executable) -> Sequence[sql.Row]:
+    connection = snapshot_connection.get()
+    if async_engine is None:
+        return await run_in_threadpool(fetch_all_sync, statement, connection)
+    if connection is not None:
+        # A failing statement must not abort the snapshot for the ones after it
+        async with connection.begin_nested():
+            result = await connection.execute(statement)
+            return result.all()
+    async with connect() as connection:
+        result = await connection.execute(statement)
+        return result.all()
+
+
+def stream_sync(
+    statement: sql.Select, connection: sql.Connection | None = None
+) -> Iterator[Sequence[sql.Row]]:
+    options = {"yield_per": STREAM_BATCH_SIZE}
+    if connection is not None:
+        with connection.begin_nested():
+            rows = connection.execute(statement, execution_options=options)
+            yield from rows.partitions()
+        return
+    with connect_sync() as connection:
+        rows = connection.execute(statement, execution_options=options)
+        yield from rows.partitions()
+
+
+async def stream(statement: sql.Select) -> AsyncIterator[Sequence[sql.Row]]:
+    connection = snapshot_connection.get()
+    if async_engine is None:
+        partitions = stream_sync(statement, connection)
+        async for partition in iterate_in_threadpool(partitions):
+            yield partition
+        return
+    options = {"yield_per": STREAM_BATCH_SIZE}
+    if connection is not None:
+        async with connection.begin_nested():
+            rows = await connection.stream(statement, execution_options=options)
+            async for partition in rows.partitions():
+                yield partition
+        return
+    async with connect() as connection:
+        rows = await connection.stream(statement, execution_options=options)
+        async for partition in rows.partitions():
+            yield partition
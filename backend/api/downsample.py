@@ -0,0 +1,66 @@
+from collections import defaultdict
+from collections.abc import Sequence
+
+
+def largest_triangle_three_buckets(
+    x: Sequence[float], y: Sequence[float], threshold: int
+) -> list[int]:
+    # Keeps the first and last points and, from every bucket in between, the point
+    # spanning the largest triangle with the previous pick and the next bucket's mean
+    size = len(x)
+    if threshold >= size or threshold < 3:
+        return list(range(size))
+    every = (size - 2) / (threshold - 2)
+    selected = [0]
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, size)
+        next_x = sum(x[end:next_end]) / (next_end - end)
+        next_y = sum(y[end:next_end]) / (next_end - end)
+        previous_x = x[previous]
+        previous_y = y[previous]
+        best_area = -1.0
+        for index in range(start, end):
+            area = abs(
+                (previous_x - next_x) * (y[index] - previous_y)
+                - (previous_x - x[index]) * (next_y - previous_y)
+            )
+            if area > best_area:
+                best_area = area
+                previous = index
+        selected.append(previous)
+    selected.append(size - 1)
+    return selected
+
+
+def downsample(
+    rows: Sequence[Sequence], max_points: int, value_position: int | None
+) -> list[Sequence]:
+    # Rows start with the country id and the year, every country is its own series
+    series: defaultdict[int, list[int]] = defaultdict(list)
+    for index, row in enumerate(rows):
+        series[row[0]].append(index)
+    kept = []
+    for indices in series.values():
+        values = None
+        if value_position is not None:
+            # Gaps from outer joins have no value to shape by, so they are left out
+            # rather than read as zeros that would stand out as extremes
+            present = [
+                index for index in indices if rows[index][value_position] is not None
+            ]
+            if len(present) > 0:
+                indices = present
+                values = [rows[index][value_position] for index in indices]
+        if values is None:
+            # Without values the points are spread evenly over the years
+            values = [0.0] * len(indices)
+        years = [rows[index][1] for index in indices]
+        kept.extend(
+            indices[position]
+            for position in largest_triangle_three_buckets(years, values, max_points)
+        )
+    kept.sort()
+    return [rows[index] for index in kept]
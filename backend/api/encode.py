@@ -0,0 +1,75 @@
+from collections.abc import Callable, Collection, Sequence
+from typing import Any
+from fastapi import HTTPException
+import pydantic as pdt
+import sqlalchemy as sql
+
+try:  # Production
+    from .links import country_href
+except ImportError:  # Development
+    from links import country_href
+
+
+def model_fields(model: type[pdt.BaseModel]) -> list[str]:
+    return [name for name, field in model.model_fields.items() if not field.exclude]
+
+
+def select_fields(model: type[pdt.BaseModel], fields: Sequence[str]) -> list[str]:
+    names = model_fields(model)
+    if len(fields) == 0:
+        return names
+    unknown = [name for name in fields if name not in names]
+    if len(unknown) > 0:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. "
+            f"Available fields: {', '.join(names)}",
+        )
+    # Fields keep the order of the model
+    return [name for name in names if name in fields]
+
+
+def record_encoder(
+    model: type[pdt.BaseModel],
+    names: Sequence[str],
+    base_url: str,
+    fields: Collection[str] | None = None,
+) -> Callable[[sql.Row], dict[str, Any]]:
+    # Rows are trusted database output laid out as (country_id, year, *names),
+    # so they are mapped onto the model's fields without validating them
+    positions = {"year": 1, **{name: index for index, name in enumerate(names, 2)}}
+    if fields is None:
+        fields = model_fields(model)
+    fields = [(name, positions.get(name)) for name in fields]
+
+    def encode(row: sql.Row) -> dict[str, Any]:
+        return {
+            name: (
+                country_href(base_url, row[0]) if position is None else row[position]
+            )
+            for name, position in fields
+        }
+
+    return encode
+
+
+def aggregate_encoder(
+    group_by: str, base_url: str
+) -> Callable[[sql.Row], dict[str, Any]]:
+    if group_by == "country":
+        return lambda row: {"country": country_href(base_url, row[0]), "value": row[1]}
+    return lambda row: {group_by: row[0], "value": row[1]}
+
+
+def series_encoder(
+    names: Sequence[str], base_url: str
+) -> Callable[[sql.Row], dict[str, Any]]:
+    # Rows are laid out as (country_id, *names)
+    positions = list(enumerate(names, 1))
+
+    def encode(row: sql.Row) -> dict[str, Any]:
+        record = {name: row[position] for position, name in positions}
+        record["country"] = country_href(base_url, row[0])
+        return record
+
+    return encode
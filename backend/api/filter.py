@@ -2,26 +2,173 @@ from typing import Literal, Annotated
 import pydantic as pdt
 
 try:  # Production
+    from .settings import BATCH_MAX_REQUESTS
     from .tags import Tags
 except ImportError:  # Development
+    from settings import BATCH_MAX_REQUESTS
     from tags import Tags
 
 
-class FilterParams(pdt.BaseModel):
-    country: Annotated[
+def split_names(values: list[str]) -> list[str]:
+    return [
+        name.strip() for value in values for name in value.split(",") if name.strip()
+    ]
+
+
+class PageParams(pdt.BaseModel):
+    limit: Annotated[
         int | None,
+        pdt.Field(default=None, ge=1, title="Maximum number of rows to return"),
+    ]
+    cursor: Annotated[
+        str | None,
         pdt.Field(
-            default=None, ge=0, title="ID of the country that is related to this data"
+            default=None,
+            title="Opaque cursor of the page to return, taken from the next link",
+        ),
+    ]
+
+
+class SliceParams(pdt.BaseModel):
+    country: Annotated[
+        list[Annotated[int, pdt.Field(ge=0)]],
+        pdt.Field(
+            default=[], title="IDs of the countries that are related to this data"
         ),
     ]
     year: Annotated[
         int | None,
         pdt.Field(default=None, ge=1900, title="Year in which this data was recorded"),
     ]
+    year_from: Annotated[
+        int | None,
+        pdt.Field(default=None, ge=1900, title="First year of the recorded data"),
+    ]
+    year_to: Annotated[
+        int | None,
+        pdt.Field(default=None, ge=1900, title="Last year of the recorded data"),
+    ]
+
+    @pdt.model_validator(mode="after")
+    def check_year_range(self) -> "SliceParams":
+        if (
+            self.year_from is not None
+            and self.year_to is not None
+            and self.year_from > self.year_to
+        ):
+            raise ValueError("year_from must not be after year_to")
+        return self
+
+
+class FilterParams(PageParams, SliceParams):
     order_by: Literal["country", "year"] = "year"
+    fields: Annotated[
+        list[str],
+        pdt.Field(
+            default=[],
+            title="Fields of the rows to return, separated by commas, or all of them",
+        ),
+    ]
+    max_points: Annotated[
+        int | None,
+        pdt.Field(
+            default=None,
+            ge=3,
+            title="Downsample every country's series to at most this many points",
+        ),
+    ]
+    stream: Annotated[
+        bool,
+        pdt.Field(
+            default=False,
+            title="Stream the rows from a server-side cursor as they are read",
+        ),
+    ]
     tags: list[Tags | str] = []
 
+    @pdt.field_validator("fields")
+    @classmethod
+    def split_fields(cls, fields: list[str]) -> list[str]:
+        return split_names(fields)
+
+    @pdt.model_validator(mode="after")
+    def check_max_points(self) -> "FilterParams":
+        if self.max_points is not None and self.limit is not None:
+            # Downsampling needs whole series, which pages would cut apart
+            raise ValueError("max_points cannot be combined with limit")
+        return self
+
 
-class CountriesFilterParams(pdt.BaseModel):
+class CombinedParams(FilterParams):
+    metric: Annotated[
+        list[str],
+        pdt.Field(
+            min_length=1,
+            title="Metrics to return side by side, separated by commas",
+        ),
+    ]
+
+    @pdt.field_validator("metric")
+    @classmethod
+    def split_metrics(cls, metric: list[str]) -> list[str]:
+        # Repeated metrics would only repeat the same column
+        return list(dict.fromkeys(split_names(metric)))
+
+
+class CountriesFilterParams(PageParams):
     order_by: Literal["id", "name"] = "id"
     tags: list[Tags | str] = [Tags.country]
+
+
+class AggregateParams(SliceParams):
+    group_by: Literal["year", "country", "decade"] = "year"
+    fn: Literal["mean", "sum", "min", "max", "count"] = "mean"
+    tags: list[Tags | str] = []
+
+
+class AnalyticsParams(SliceParams):
+    tags: list[Tags | str] = []
+
+
+class RollingParams(AnalyticsParams):
+    window: Annotated[
+        int,
+        pdt.Field(default=5, ge=2, le=50, title="Number of years in every mean"),
+    ]
+
+
+class TopParams(pdt.BaseModel):
+    year: Annotated[
+        int | None,
+        pdt.Field(
+            default=None,
+            ge=1900,
+            title="Year to rank the countries in, the latest by default",
+        ),
+    ]
+    n: Annotated[
+        int, pdt.Field(default=10, ge=1, le=250, title="Number of countries to return")
+    ]
+    order: Literal["desc", "asc"] = "desc"
+    tags: list[Tags | str] = []
+
+
+class BatchParams(pdt.BaseModel):
+    requests: Annotated[
+        list[str],
+        pdt.Field(
+            min_length=1,
+            max_length=BATCH_MAX_REQUESTS,
+            title="Paths of the GET requests to run, with their query strings",
+        ),
+    ]
+
+    @pdt.field_validator("requests")
+    @classmethod
+    def check_paths(cls, requests: list[str]) -> list[str]:
+        for path in requests:
+            if not path.startswith("/"):
+                raise ValueError(f"{path} is not an absolute path")
+            if path.split("?", 1)[0].rstrip("/") == "/batch":
+                raise ValueError("Batches cannot be nested")
+        return requests
@@ -0,0 +1,50 @@
+from functools import lru_cache
+import pydantic as pdt
+
+BASE_URL_CACHE_SIZE = 16
+COUNTRY_LINKS = [
+    "temperatures",
+    "population",
+    "gdp",
+    "pollution",
+    "energy",
+    "hydrosphere",
+    "rainfall",
+    "disasters",
+    "forests",
+]
+
+
+@lru_cache(maxsize=BASE_URL_CACHE_SIZE)
+def country_links_table(base_url: str) -> dict[int, dict[str, pdt.HttpUrl]]:
+    # Filled lazily with every country seen under this base url
+    return {}
+
+
+def country_links(base_url: str, country_id: int) -> dict[str, pdt.HttpUrl]:
+    links_table = country_links_table(base_url)
+    links = links_table.get(country_id)
+    if links is None:
+        links = {"url": pdt.HttpUrl(f"{base_url}countries/{country_id}")}
+        for name in COUNTRY_LINKS:
+            links[name] = pdt.HttpUrl(f"{base_url}{name}?country={country_id}")
+        links_table[country_id] = links
+    return links
+
+
+def country_url(base_url: str, country_id: int) -> pdt.HttpUrl:
+    return country_links(base_url, country_id)["url"]
+
+
+@lru_cache(maxsize=BASE_URL_CACHE_SIZE)
+def country_hrefs_table(base_url: str) -> dict[int, str]:
+    return {}
+
+
+def country_href(base_url: str, country_id: int) -> str:
+    hrefs_table = country_hrefs_table(base_url)
+    href = hrefs_table.get(country_id)
+    if href is None:
+        href = str(country_url(base_url, country_id))
+        hrefs_table[country_id] = href
+    return href
@@ -1,7 +1,11 @@
+import contextlib
+from collections.abc import AsyncIterator, Awaitable, Callable, Sequence
 from typing import Annotated
-from fastapi import FastAPI, Request, Query, Path
+from fastapi import FastAPI, Request, Response, Query, Path
+from fastapi.responses import StreamingResponse
 import uvicorn
 import pydantic as pdt
+import pydantic_core
 import sqlalchemy as sql
 import sqlalchemy.orm as orm
 import db
@@ -9,687 +13,639 @@ import db
 try:  # Production
     from .tags import Tags
     from .model import *
-    from .filter import FilterParams, CountriesFilterParams
+    from .filter import (
+        AggregateParams,
+        AnalyticsParams,
+        BatchParams,
+        CombinedParams,
+        CountriesFilterParams,
+        FilterParams,
+        RollingParams,
+        TopParams,
+    )
+    from .measures import MEASURES, select_metrics
+    from .query import (
+        aggregate_statement,
+        change_statement,
+        filter_statement,
+        page_statement,
+        paginate,
+        rolling_statement,
+        rollup_statement,
+        top_statement,
+        trend_statement,
+    )
+    from .batch import encode_results, run_request
+    from .cache import ResponseCache
+    from .conditional import ConditionalGet
+    from .database import fetch_all, pool_metrics, snapshot_transaction, stream
+    from .downsample import downsample
+    from .columnar import accepts_columnar, encode_columnar
+    from .encode import (
+        aggregate_encoder,
+        record_encoder,
+        select_fields,
+        series_encoder,
+    )
+    from .links import country_links
+    from .settings import (
+        CACHE_MAX_BODY_SIZE,
+        CACHE_MAX_BYTES,
+        CACHE_SIZE,
+        CACHE_TTL,
+        MEMORY_STORE,
+        VERSION_POLL_INTERVAL,
+    )
+    from .stream import (
+        NDJSON_MEDIA_TYPE,
+        accepts_ndjson,
+        encode_ndjson,
+        encode_stream,
+    )
+    from .store import MemoryStore
+    from .version import DatasetVersions
 except ImportError:  # Development
     from tags import Tags
     from model import *
-    from filter import FilterParams, CountriesFilterParams
+    from filter import (
+        AggregateParams,
+        AnalyticsParams,
+        BatchParams,
+        CombinedParams,
+        CountriesFilterParams,
+        FilterParams,
+        RollingParams,
+        TopParams,
+    )
+    from measures import MEASURES, select_metrics
+    from query import (
+        aggregate_statement,
+        change_statement,
+        filter_statement,
+        page_statement,
+        paginate,
+        rolling_statement,
+        rollup_statement,
+        top_statement,
+        trend_statement,
+    )
+    from batch import encode_results, run_request
+    from cache import ResponseCache
+    from conditional import ConditionalGet
+    from database import fetch_all, pool_metrics, snapshot_transaction, stream
+    from downsample import downsample
+    from columnar import accepts_columnar, encode_columnar
+    from encode import (
+        aggregate_encoder,
+        record_encoder,
+        select_fields,
+        series_encoder,
+    )
+    from links import country_links
+    from settings import (
+        CACHE_MAX_BODY_SIZE,
+        CACHE_MAX_BYTES,
+        CACHE_SIZE,
+        CACHE_TTL,
+        MEMORY_STORE,
+        VERSION_POLL_INTERVAL,
+    )
+    from stream import (
+        NDJSON_MEDIA_TYPE,
+        accepts_ndjson,
+        encode_ndjson,
+        encode_stream,
+    )
+    from store import MemoryStore
+    from version import DatasetVersions
+
+
+countries_adapter = pdt.TypeAdapter(list[Country])
+dataset_versions = DatasetVersions(VERSION_POLL_INTERVAL)
+memory_store = MemoryStore(dataset_versions) if MEMORY_STORE else None
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    if memory_store is not None:
+        # Load the data before the first request has to wait for it
+        await memory_store.current()
+    yield
+
+
+app = FastAPI(title="Dashboard API", root_path="/api/v1", lifespan=lifespan)
+conditional_get = ConditionalGet(dataset_versions)
+response_cache = ResponseCache(
+    dataset_versions, CACHE_SIZE, CACHE_TTL, CACHE_MAX_BODY_SIZE, CACHE_MAX_BYTES
+)
 
 
-app = FastAPI(title="Dashboard API", root_path="/api/v1")
-engine = sql.create_engine(
-    f"postgresql+psycopg2://\
-{db.USERNAME}:{db.PASSWORD}@\
-{db.CONTAINER_HOST}:{db.CONTAINER_PORT}/\
-{db.DATABASE_NAME}",
-    pool_pre_ping=True,
-)
-session_factory = orm.sessionmaker(bind=engine)
+async def list_data(
+    request: Request,
+    filter_query: FilterParams,
+    model: type[pdt.BaseModel],
+    table: type[db.Base],
+    *columns: orm.InstrumentedAttribute,
+) -> Response:
+    fields = select_fields(model, filter_query.fields)
+    # The key columns are always read, they order the rows and build the cursor
+    columns = [column for column in columns if column.key in fields]
+    selected = [table.country_id, table.year, *columns]
+    statement = sql.select(*selected).select_from(table)
+    for other in dict.fromkeys(column.class_ for column in columns):
+        if other is table:
+            continue
+        # Every table has one row per country and year, so the join keeps rows aligned
+        statement = statement.outerjoin(
+            other,
+            sql.and_(other.country_id == table.country_id, other.year == table.year),
+        )
+    statement = filter_statement(statement, table, filter_query)
+    encode = record_encoder(
+        model, [column.key for column in columns], str(request.base_url), fields
+    )
+    columnar = accepts_columnar(request)
+    ndjson = accepts_ndjson(request)
+    streaming = columnar is None and (filter_query.stream or ndjson)
+    media_type = NDJSON_MEDIA_TYPE if ndjson else "application/json"
+    if memory_store is not None:
+        # The store answers from memory, so there is nothing to stream from
+        snapshot = await memory_store.current()
+        rows = snapshot.select(table, columns, filter_query)
+    elif streaming and filter_query.limit is None and filter_query.max_points is None:
+        batches = ([encode(row) for row in batch] async for batch in stream(statement))
+        return StreamingResponse(encode_stream(batches, ndjson), media_type=media_type)
+    else:
+        rows = await fetch_all(statement)
+    if filter_query.max_points is not None:
+        # The first metric shapes the series, fields can choose which one
+        rows = downsample(rows, filter_query.max_points, 2 if columns else None)
+    # Rows start with the country id and the year
+    key = [1, 0] if filter_query.order_by == "year" else [0, 1]
+    rows, link = paginate(request, filter_query, filter_query.order_by, rows, key)
+    headers = {} if link is None else {"Link": link}
+    if columnar is not None:
+        # Rows keep the country id instead of the country link
+        return Response(
+            encode_columnar(rows, selected, columnar),
+            media_type=columnar,
+            headers=headers,
+        )
+    records = [encode(row) for row in rows]
+    if ndjson:
+        # Pages are bounded by the limit, so they are sent in one piece
+        return Response(encode_ndjson(records), media_type=media_type, headers=headers)
+    return Response(
+        pydantic_core.to_json(records), media_type=media_type, headers=headers
+    )
 
 
 @app.get("/countries", tags=[Tags.country])
-def get_countries(
+@conditional_get(db.Country)
+@response_cache
+async def get_countries(
     filter_query: Annotated[CountriesFilterParams, Query()],
     request: Request,
 ) -> list[Country]:
-    with session_factory.begin() as session:
-        statement = sql.select(db.Country.id, db.Country.name)
-        statement = statement.order_by(None)
-        # Default ordering first
-        if filter_query.order_by == "id":
-            statement = statement.order_by(db.Country.id)
-        else:
-            statement = statement.order_by(db.Country.name)
-        countries = session.execute(statement)
-        countries = countries.all()
-        countries = [
-            Country(
-                id=country_id,
-                name=name,
-                url=pdt.HttpUrl(f"{request.base_url}countries/{country_id}"),
-                temperatures=pdt.HttpUrl(
-                    f"{request.base_url}temperatures?country={country_id}"
-                ),
-                population=pdt.HttpUrl(
-                    f"{request.base_url}population?country={country_id}"
-                ),
-                gdp=pdt.HttpUrl(f"{request.base_url}gdp?country={country_id}"),
-                pollution=pdt.HttpUrl(
-                    f"{request.base_url}pollution?country={country_id}"
-                ),
-                energy=pdt.HttpUrl(f"{request.base_url}energy?country={country_id}"),
-                hydrosphere=pdt.HttpUrl(
-                    f"{request.base_url}hydrosphere?country={country_id}"
-                ),
-                rainfall=pdt.HttpUrl(
-                    f"{request.base_url}rainfall?country={country_id}"
-                ),
-                disasters=pdt.HttpUrl(
-                    f"{request.base_url}disasters?country={country_id}"
-                ),
-                forests=pdt.HttpUrl(f"{request.base_url}forests?country={country_id}"),
-            )
-            for country_id, name in countries
-        ]
-        return countries
+    statement = sql.select(db.Country.id, db.Country.name)
+    # Default ordering first
+    if filter_query.order_by == "id":
+        key = [db.Country.id]
+        positions = [0]
+    else:
+        key = [db.Country.name, db.Country.id]
+        positions = [1, 0]
+    statement = page_statement(statement, key, filter_query, filter_query.order_by)
+    countries = await fetch_all(statement)
+    countries, link = paginate(
+        request, filter_query, filter_query.order_by, countries, positions
+    )
+    headers = {} if link is None else {"Link": link}
+    base_url = str(request.base_url)
+    countries = [
+        Country(id=country_id, name=name, **country_links(base_url, country_id))
+        for country_id, name in countries
+    ]
+    return Response(
+        countries_adapter.dump_json(countries),
+        media_type="application/json",
+        headers=headers,
+    )
 
 
 @app.get("/countries/{country_id}", tags=[Tags.country])
-def get_country(
+@conditional_get(db.Country)
+@response_cache
+async def get_country(
     country_id: Annotated[int, Path(ge=0, title="ID of the country to get")],
     request: Request,
 ) -> Country | None:
-    with session_factory.begin() as session:
-        statement = sql.select(db.Country).where(db.Country.id == country_id)
-        country = session.execute(statement)
-        country = country.scalar_one_or_none()
-        if country is None:
-            return None
-        return Country(
-            id=country.id,
-            name=country.name,
-            url=pdt.HttpUrl(f"{request.base_url}countries/{country_id}"),
-            temperatures=pdt.HttpUrl(
-                f"{request.base_url}temperatures?country={country_id}"
-            ),
-            population=pdt.HttpUrl(
-                f"{request.base_url}population?country={country_id}"
-            ),
-            gdp=pdt.HttpUrl(f"{request.base_url}gdp?country={country_id}"),
-            pollution=pdt.HttpUrl(f"{request.base_url}pollution?country={country_id}"),
-            energy=pdt.HttpUrl(f"{request.base_url}energy?country={country_id}"),
-            hydrosphere=pdt.HttpUrl(
-                f"{request.base_url}hydrosphere?country={country_id}"
-            ),
-            rainfall=pdt.HttpUrl(f"{request.base_url}rainfall?country={country_id}"),
-            disasters=pdt.HttpUrl(f"{request.base_url}disasters?country={country_id}"),
-            forests=pdt.HttpUrl(f"{request.base_url}forests?country={country_id}"),
-        )
+    statement = sql.select(db.Country.id, db.Country.name).where(
+        db.Country.id == country_id
+    )
+    countries = await fetch_all(statement)
+    if len(countries) == 0:
+        return Response(b"null", media_type="application/json")
+    country_id, name = countries[0]
+    country = Country(
+        id=country_id,
+        name=name,
+        **country_links(str(request.base_url), country_id),
+    )
+    return Response(country.model_dump_json(), media_type="application/json")
 
 
 @app.get("/temperatures", tags=[Tags.temperature])
-def get_temperatures(
+@conditional_get(db.Temperature)
+@response_cache
+async def get_temperatures(
     filter_query: Annotated[FilterParams, Query()],
     request: Request,
 ) -> list[Temperature]:
-    with session_factory.begin() as session:
-        statement = sql.select(
-            db.Temperature.country_id,
-            db.Temperature.year,
-            db.Temperature.average_temperature,
-            db.Temperature.temperature_anomaly,
-        )
-        if filter_query.country is not None:
-            statement = statement.where(
-                db.Temperature.country_id == filter_query.country
-            )
-        if filter_query.year is not None:
-            statement = statement.where(db.Temperature.year == filter_query.year)
-        statement = statement.order_by(None)
-        # Default ordering first
-        if filter_query.order_by == "year":
-            statement = statement.order_by(db.Temperature.year)
-        else:
-            statement = statement.order_by(db.Temperature.country_id)
-        temperatures = session.execute(statement)
-        temperatures = [
-            Temperature(
-                country=pdt.HttpUrl(f"{request.base_url}countries/{country_id}"),
-                year=year_,
-                average_temperature=average_temperature,
-                temperature_anomaly=temperature_anomaly,
-            )
-            for country_id, year_, average_temperature, temperature_anomaly in temperatures
-        ]
-        return temperatures
+    return await list_data(
+        request,
+        filter_query,
+        Temperature,
+        db.Temperature,
+        db.Temperature.average_temperature,
+        db.Temperature.temperature_anomaly,
+    )
 
 
 @app.get("/temperatures/average", tags=[Tags.temperature])
-def get_average_temperatures(
+@conditional_get(db.Temperature)
+@response_cache
+async def get_average_temperatures(
     filter_query: Annotated[FilterParams, Query()],
     request: Request,
 ) -> list[AverageTemperature]:
-    with session_factory.begin() as session:
-        statement = sql.select(
-            db.Temperature.country_id,
-            db.Temperature.year,
-            db.Temperature.average_temperature,
-        )
-        if filter_query.country is not None:
-            statement = statement.where(
-                db.Temperature.country_id == filter_query.country
-            )
-        if filter_query.year is not None:
-            statement = statement.where(db.Temperature.year == filter_query.year)
-        statement = statement.order_by(None)
-        # Default ordering first
-        if filter_query.order_by == "year":
-            statement = statement.order_by(db.Temperature.year)
-        else:
-            statement = statement.order_by(db.Temperature.country_id)
-        average_temperatures = session.execute(statement)
-        average_temperatures = [
-            AverageTemperature(
-                country=pdt.HttpUrl(f"{request.base_url}countries/{country_id}"),
-                year=year_,
-                average_temperature=average_temperature,
-            )
-            for country_id, year_, average_temperature in average_temperatures
-        ]
-        return average_temperatures
+    return await list_data(
+        request,
+        filter_query,
+        AverageTemperature,
+        db.Temperature,
+        db.Temperature.average_temperature,
+    )
 
 
 @app.get("/temperatures/anomaly", tags=[Tags.temperature])
-def get_temperature_anomalies(
+@conditional_get(db.Temperature)
+@response_cache
+async def get_temperature_anomalies(
     filter_query: Annotated[FilterParams, Query()],
     request: Request,
 ) -> list[TemperatureAnomaly]:
-    with session_factory.begin() as session:
-        statement = sql.select(
-            db.Temperature.country_id,
-            db.Temperature.year,
-            db.Temperature.temperature_anomaly,
-        )
-        if filter_query.country is not None:
-            statement = statement.where(
-                db.Temperature.country_id == filter_query.country
-            )
-        if filter_query.year is not None:
-            statement = statement.where(db.Temperature.year == filter_query.year)
-        statement = statement.order_by(None)
-        # Default ordering first
-        if filter_query.order_by == "year":
-            statement = statement.order_by(db.Temperature.year)
-        else:
-            statement = statement.order_by(db.Temperature.country_id)
-        temperature_anomalies = session.execute(statement)
-        temperature_anomalies = [
-            TemperatureAnomaly(
-                country=pdt.HttpUrl(f"{request.base_url}countries/{country_id}"),
-                year=year_,
-                temperature_anomaly=temperature_anomaly,
-            )
-            for country_id, year_, temperature_anomaly in temperature_anomalies
-        ]
-        return temperature_anomalies
+    return await list_data(
+        request,
+        filter_query,
+        TemperatureAnomaly,
+        db.Temperature,
+        db.Temperature.temperature_anomaly,
+    )
 
 
 @app.get("/population", tags=[Tags.population])
-def get_population(
+@conditional_get(db.Population)
+@response_cache
+async def get_population(
     filter_query: Annotated[FilterParams, Query()],
     request: Request,
 ) -> list[Population]:
-    with session_factory.begin() as session:
-        statement = sql.select(
-            db.Population.country_id,
-            db.Population.year,
-            db.Population.population,
-        )
-        if filter_query.country is not None:
-            statement = statement.where(
-                db.Population.country_id == filter_query.country
-            )
-        if filter_query.year is not None:
-            statement = statement.where(db.Population.year == filter_query.year)
-        statement = statement.order_by(None)
-        # Default ordering first
-        if filter_query.order_by == "year":
-            statement = statement.order_by(db.Population.year)
-        else:
-            statement = statement.order_by(db.Population.country_id)
-        population = session.execute(statement)
-        population = [
-            Population(
-                country=pdt.HttpUrl(f"{request.base_url}countries/{country_id}"),
-                year=year_,
-                population=population_,
-            )
-            for country_id, year_, population_ in population
-        ]
-        return population
+    return await list_data(
+        request,
+        filter_query,
+        Population,
+        db.Population,
+        db.Population.population,
+    )
 
 
 @app.get("/gdp", tags=[Tags.gdp])
-def get_gdp(
+@conditional_get(db.Population)
+@response_cache
+async def get_gdp(
     filter_query: Annotated[FilterParams, Query()],
     request: Request,
 ) -> list[GDP]:
-    with session_factory.begin() as session:
-        statement = sql.select(
-            db.Population.country_id,
-            db.Population.year,
-            db.Population.gdp,
-        )
-        if filter_query.country is not None:
-            statement = statement.where(
-                db.Population.country_id == filter_query.country
-            )
-        if filter_query.year is not None:
-            statement = statement.where(db.Population.year == filter_query.year)
-        statement = statement.order_by(None)
-        # Default ordering first
-        if filter_query.order_by == "year":
-            statement = statement.order_by(db.Population.year)
-        else:
-            statement = statement.order_by(db.Population.country_id)
-        gdp = session.execute(statement)
-        gdp = [
-            GDP(
-                country=pdt.HttpUrl(f"{request.base_url}countries/{country_id}"),
-                year=year_,
-                gdp=gdp_,
-            )
-            for country_id, year_, gdp_ in gdp
-        ]
-        return gdp
+    return await list_data(
+        request,
+        filter_query,
+        GDP,
+        db.Population,
+        db.Population.gdp,
+    )
 
 
 @app.get("/pollution", tags=[Tags.pollution])
-def get_pollution(
+@conditional_get(db.Pollution)
+@response_cache
+async def get_pollution(
     filter_query: Annotated[FilterParams, Query()],
     request: Request,
 ) -> list[Pollution]:
-    with session_factory.begin() as session:
-        statement = sql.select(
-            db.Pollution.country_id,
-            db.Pollution.year,
-            db.Pollution.co2_emissions,
-            db.Pollution.methane_emissions,
-            db.Pollution.air_pollution_index,
-            db.Pollution.ocean_acidification,
-            db.Pollution.per_capita_emissions,
-        )
-        if filter_query.country is not None:
-            statement = statement.where(db.Pollution.country_id == filter_query.country)
-        if filter_query.year is not None:
-            statement = statement.where(db.Pollution.year == filter_query.year)
-        statement = statement.order_by(None)
-        # Default ordering first
-        if filter_query.order_by == "year":
-            statement = statement.order_by(db.Pollution.year)
-        else:
-            statement = statement.order_by(db.Pollution.country_id)
-        pollution = session.execute(statement)
-        pollution = [
-            Pollution(
-                country=pdt.HttpUrl(f"{request.base_url}countries/{country_id}"),
-                year=year_,
-                co2_emissions=co2_emissions,
-                methane_emissions=methane_emissions,
-                air_pollution_index=air_pollution_index,
-                ocean_acidification=ocean_acidification,
-                per_capita_emissions=per_capita_emissions,
-            )
-            for (
-                country_id,
-                year_,
-                co2_emissions,
-                methane_emissions,
-                air_pollution_index,
-                ocean_acidification,
-                per_capita_emissions,
-            ) in pollution
-        ]
-        return pollution
+    return await list_data(
+        request,
+        filter_query,
+        Pollution,
+        db.Pollution,
+        db.Pollution.co2_emissions,
+        db.Pollution.methane_emissions,
+        db.Pollution.air_pollution_index,
+        db.Pollution.ocean_acidification,
+        db.Pollution.per_capita_emissions,
+    )
 
 
 @app.get("/pollution/co2", tags=[Tags.pollution])
-def get_co2_emissions(
+@conditional_get(db.Pollution)
+@response_cache
+async def get_co2_emissions(
     filter_query: Annotated[FilterParams, Query()],
     request: Request,
 ) -> list[CO2Emissions]:
-    with session_factory.begin() as session:
-        statement = sql.select(
-            db.Pollution.country_id,
-            db.Pollution.year,
-            db.Pollution.co2_emissions,
-        )
-        if filter_query.country is not None:
-            statement = statement.where(db.Pollution.country_id == filter_query.country)
-        if filter_query.year is not None:
-            statement = statement.where(db.Pollution.year == filter_query.year)
-        statement = statement.order_by(None)
-        # Default ordering first
-        if filter_query.order_by == "year":
-            statement = statement.order_by(db.Pollution.year)
-        else:
-            statement = statement.order_by(db.Pollution.country_id)
-        co2_emissions = session.execute(statement)
-        co2_emissions = [
-            CO2Emissions(
-                country=pdt.HttpUrl(f"{request.base_url}countries/{country_id}"),
-                year=year_,
-                co2_emissions=co2_emissions_,
-            )
-            for country_id, year_, co2_emissions_ in co2_emissions
-        ]
-        return co2_emissions
+    return await list_data(
+        request,
+        filter_query,
+        CO2Emissions,
+        db.Pollution,
+        db.Pollution.co2_emissions,
+    )
 
 
 @app.get("/pollution/methane", tags=[Tags.pollution])
-def get_methane_emissions(
+@conditional_get(db.Pollution)
+@response_cache
+async def get_methane_emissions(
     filter_query: Annotated[FilterParams, Query()],
     request: Request,
 ) -> list[MethaneEmissions]:
-    with session_factory.begin() as session:
-        statement = sql.select(
-            db.Pollution.country_id,
-            db.Pollution.year,
-            db.Pollution.methane_emissions,
-        )
-        if filter_query.country is not None:
-            statement = statement.where(db.Pollution.country_id == filter_query.country)
-        if filter_query.year is not None:
-            statement = statement.where(db.Pollution.year == filter_query.year)
-        statement = statement.order_by(None)
-        # Default ordering first
-        if filter_query.order_by == "year":
-            statement = statement.order_by(db.Pollution.year)
-        else:
-            statement = statement.order_by(db.Pollution.country_id)
-        methane_emissions = session.execute(statement)
-        methane_emissions = [
-            MethaneEmissions(
-                country=pdt.HttpUrl(f"{request.base_url}countries/{country_id}"),
-                year=year_,
-                methane_emissions=methane_emissions_,
-            )
-            for country_id, year_, methane_emissions_ in methane_emissions
-        ]
-        return methane_emissions
+    return await list_data(
+        request,
+        filter_query,
+        MethaneEmissions,
+        db.Pollution,
+        db.Pollution.methane_emissions,
+    )
 
 
 @app.get("/pollution/air-pollution-index", tags=[Tags.pollution])
-def get_air_pollution_index(
+@conditional_get(db.Pollution)
+@response_cache
+async def get_air_pollution_index(
     filter_query: Annotated[FilterParams, Query()],
     request: Request,
 ) -> list[AirPollutionIndex]:
-    with session_factory.begin() as session:
-        statement = sql.select(
-            db.Pollution.country_id,
-            db.Pollution.year,
-            db.Pollution.air_pollution_index,
-        )
-        if filter_query.country is not None:
-            statement = statement.where(db.Pollution.country_id == filter_query.country)
-        if filter_query.year is not None:
-            statement = statement.where(db.Pollution.year == filter_query.year)
-        statement = statement.order_by(None)
-        # Default ordering first
-        if filter_query.order_by == "year":
-            statement = statement.order_by(db.Pollution.year)
-        else:
-            statement = statement.order_by(db.Pollution.country_id)
-        air_pollution_index = session.execute(statement)
-        air_pollution_index = [
-            AirPollutionIndex(
-                country=pdt.HttpUrl(f"{request.base_url}countries/{country_id}"),
-                year=year_,
-                air_pollution_index=air_pollution_index_,
-            )
-            for country_id, year_, air_pollution_index_ in air_pollution_index
-        ]
-        return air_pollution_index
+    return await list_data(
+        request,
+        filter_query,
+        AirPollutionIndex,
+        db.Pollution,
+        db.Pollution.air_pollution_index,
+    )
 
 
 @app.get("/pollution/ocean-acidification", tags=[Tags.pollution])
-def get_ocean_acidification(
+@conditional_get(db.Pollution)
+@response_cache
+async def get_ocean_acidification(
     filter_query: Annotated[FilterParams, Query()],
     request: Request,
 ) -> list[OceanAcidification]:
-    with session_factory.begin() as session:
-        statement = sql.select(
-            db.Pollution.country_id,
-            db.Pollution.year,
-            db.Pollution.ocean_acidification,
-        )
-        if filter_query.country is not None:
-            statement = statement.where(db.Pollution.country_id == filter_query.country)
-        if filter_query.year is not None:
-            statement = statement.where(db.Pollution.year == filter_query.year)
-        statement = statement.order_by(None)
-        # Default ordering first
-        if filter_query.order_by == "year":
-            statement = statement.order_by(db.Pollution.year)
-        else:
-            statement = statement.order_by(db.Pollution.country_id)
-        ocean_acidification = session.execute(statement)
-        ocean_acidification = [
-            OceanAcidification(
-                country=pdt.HttpUrl(f"{request.base_url}countries/{country_id}"),
-                year=year_,
-                ocean_acidification=ocean_acidification_,
-            )
-            for country_id, year_, ocean_acidification_ in ocean_acidification
-        ]
-        return ocean_acidification
+    return await list_data(
+        request,
+        filter_query,
+        OceanAcidification,
+        db.Pollution,
+        db.Pollution.ocean_acidification,
+    )
 
 
 @app.get("/pollution/per-capita", tags=[Tags.pollution])
-def get_per_capita_emissions(
+@conditional_get(db.Pollution)
+@response_cache
+async def get_per_capita_emissions(
     filter_query: Annotated[FilterParams, Query()],
     request: Request,
 ) -> list[PerCapitaEmissions]:
-    with session_factory.begin() as session:
-        statement = sql.select(
-            db.Pollution.country_id,
-            db.Pollution.year,
-            db.Pollution.per_capita_emissions,
-        )
-        if filter_query.country is not None:
-            statement = statement.where(db.Pollution.country_id == filter_query.country)
-        if filter_query.year is not None:
-            statement = statement.where(db.Pollution.year == filter_query.year)
-        statement = statement.order_by(None)
-        # Default ordering first
-        if filter_query.order_by == "year":
-            statement = statement.order_by(db.Pollution.year)
-        else:
-            statement = statement.order_by(db.Pollution.country_id)
-        per_capita_emissions = session.execute(statement)
-        per_capita_emissions = [
-            PerCapitaEmissions(
-                country=pdt.HttpUrl(f"{request.base_url}countries/{country_id}"),
-                year=year_,
-                per_capita_emissions=per_capita_emissions_,
-            )
-            for country_id, year_, per_capita_emissions_ in per_capita_emissions
-        ]
-        return per_capita_emissions
+    return await list_data(
+        request,
+        filter_query,
+        PerCapitaEmissions,
+        db.Pollution,
+        db.Pollution.per_capita_emissions,
+    )
 
 
 @app.get("/energy", tags=[Tags.energy])
-def get_energy(
+@conditional_get(db.Energy)
+@response_cache
+async def get_energy(
     filter_query: Annotated[FilterParams, Query()],
     request: Request,
 ) -> list[Energy]:
-    with session_factory.begin() as session:
-        statement = sql.select(
-            db.Energy.country_id,
-            db.Energy.year,
-            db.Energy.renewable_energy_usage,
-            db.Energy.solar_energy_potential,
-            db.Energy.fossil_fuel_usage,
-            db.Energy.energy_consumption_per_capita,
-        )
-        if filter_query.country is not None:
-            statement = statement.where(db.Energy.country_id == filter_query.country)
-        if filter_query.year is not None:
-            statement = statement.where(db.Energy.year == filter_query.year)
-        statement = statement.order_by(None)
-        # Default ordering first
-        if filter_query.order_by == "year":
-            statement = statement.order_by(db.Energy.year)
-        else:
-            statement = statement.order_by(db.Energy.country_id)
-        energy = session.execute(statement)
-        energy = [
-            Energy(
-                country=pdt.HttpUrl(f"{request.base_url}countries/{country_id}"),
-                year=year_,
-                renewable_energy_usage=renewable_energy_usage,
-                solar_energy_potential=solar_energy_potential,
-                fossil_fuel_usage=fossil_fuel_usage,
-                energy_consumption_per_capita=energy_consumption_per_capita,
-            )
-            for (
-                country_id,
-                year_,
-                renewable_energy_usage,
-                solar_energy_potential,
-                fossil_fuel_usage,
-                energy_consumption_per_capita,
-            ) in energy
-        ]
-        return energy
+    return await list_data(
+        request,
+        filter_query,
+        Energy,
+        db.Energy,
+        db.Energy.renewable_energy_usage,
+        db.Energy.solar_energy_potential,
+        db.Energy.fossil_fuel_usage,
+        db.Energy.energy_consumption_per_capita,
+    )
 
 
 @app.get("/hydrosphere", tags=[Tags.hydrosphere])
-def get_hydrosphere(
+@conditional_get(db.Hydrosphere)
+@response_cache
+async def get_hydrosphere(
     filter_query: Annotated[FilterParams, Query()],
     request: Request,
 ) -> list[Hydrosphere]:
-    with session_factory.begin() as session:
-        statement = sql.select(
-            db.Hydrosphere.country_id,
-            db.Hydrosphere.year,
-            db.Hydrosphere.sea_level_rise,
-            db.Hydrosphere.arctic_ice_extent,
-            db.Hydrosphere.average_rainfall,
-        )
-        if filter_query.country is not None:
-            statement = statement.where(
-                db.Hydrosphere.country_id == filter_query.country
-            )
-        if filter_query.year is not None:
-            statement = statement.where(db.Hydrosphere.year == filter_query.year)
-        statement = statement.order_by(None)
-        # Default ordering first
-        if filter_query.order_by == "year":
-            statement = statement.order_by(db.Hydrosphere.year)
-        else:
-            statement = statement.order_by(db.Hydrosphere.country_id)
-        hydrosphere = session.execute(statement)
-        hydrosphere = [
-            Hydrosphere(
-                country=pdt.HttpUrl(f"{request.base_url}countries/{country_id}"),
-                year=year_,
-                sea_level_rise=sea_level_rise,
-                arctic_ice_extent=arctic_ice_extent,
-                average_rainfall=average_rainfall,
-            )
-            for (
-                country_id,
-                year_,
-                sea_level_rise,
-                arctic_ice_extent,
-                average_rainfall,
-            ) in hydrosphere
-        ]
-        return hydrosphere
+    return await list_data(
+        request,
+        filter_query,
+        Hydrosphere,
+        db.Hydrosphere,
+        db.Hydrosphere.sea_level_rise,
+        db.Hydrosphere.arctic_ice_extent,
+        db.Hydrosphere.average_rainfall,
+    )
 
 
 @app.get("/rainfall", tags=[Tags.hydrosphere])
-def get_rainfall(
+@conditional_get(db.Hydrosphere)
+@response_cache
+async def get_rainfall(
     filter_query: Annotated[FilterParams, Query()],
     request: Request,
 ) -> list[Rainfall]:
-    with session_factory.begin() as session:
-        statement = sql.select(
-            db.Hydrosphere.country_id,
-            db.Hydrosphere.year,
-            db.Hydrosphere.average_rainfall,
-        )
-        if filter_query.country is not None:
-            statement = statement.where(
-                db.Hydrosphere.country_id == filter_query.country
-            )
-        if filter_query.year is not None:
-            statement = statement.where(db.Hydrosphere.year == filter_query.year)
-        statement = statement.order_by(None)
-        # Default ordering first
-        if filter_query.order_by == "year":
-            statement = statement.order_by(db.Hydrosphere.year)
-        else:
-            statement = statement.order_by(db.Hydrosphere.country_id)
-        rainfall = session.execute(statement)
-        rainfall = [
-            Rainfall(
-                country=pdt.HttpUrl(f"{request.base_url}countries/{country_id}"),
-                year=year_,
-                average_rainfall=average_rainfall,
-            )
-            for country_id, year_, average_rainfall in rainfall
-        ]
-        return rainfall
+    return await list_data(
+        request,
+        filter_query,
+        Rainfall,
+        db.Hydrosphere,
+        db.Hydrosphere.average_rainfall,
+    )
 
 
 @app.get("/disasters", tags=[Tags.disaster])
-def get_disasters(
+@conditional_get(db.Disaster)
+@response_cache
+async def get_disasters(
     filter_query: Annotated[FilterParams, Query()],
     request: Request,
 ) -> list[Disaster]:
-    with session_factory.begin() as session:
-        statement = sql.select(
-            db.Disaster.country_id,
-            db.Disaster.year,
-            db.Disaster.extreme_weather_events,
-        )
-        if filter_query.country is not None:
-            statement = statement.where(db.Disaster.country_id == filter_query.country)
-        if filter_query.year is not None:
-            statement = statement.where(db.Disaster.year == filter_query.year)
-        statement = statement.order_by(None)
-        # Default ordering first
-        if filter_query.order_by == "year":
-            statement = statement.order_by(db.Disaster.year)
-        else:
-            statement = statement.order_by(db.Disaster.country_id)
-        disasters = session.execute(statement)
-        disasters = [
-            Disaster(
-                country=pdt.HttpUrl(f"{request.base_url}countries/{country_id}"),
-                year=year_,
-                extreme_weather_events=extreme_weather_events,
-            )
-            for country_id, year_, extreme_weather_events in disasters
-        ]
-        return disasters
+    return await list_data(
+        request,
+        filter_query,
+        Disaster,
+        db.Disaster,
+        db.Disaster.extreme_weather_events,
+    )
 
 
 @app.get("/forests", tags=[Tags.forest])
-def get_forests(
+@conditional_get(db.Forest)
+@response_cache
+async def get_forests(
     filter_query: Annotated[FilterParams, Query()],
     request: Request,
 ) -> list[Forest]:
-    with session_factory.begin() as session:
-        statement = sql.select(
-            db.Forest.country_id,
-            db.Forest.year,
-            db.Forest.forest_area,
-            db.Forest.deforestation_rate,
-        )
-        if filter_query.country is not None:
-            statement = statement.where(db.Forest.country_id == filter_query.country)
-        if filter_query.year is not None:
-            statement = statement.where(db.Forest.year == filter_query.year)
-        statement = statement.order_by(None)
-        # Default ordering first
-        if filter_query.order_by == "year":
-            statement = statement.order_by(db.Forest.year)
+    return await list_data(
+        request,
+        filter_query,
+        Forest,
+        db.Forest,
+        db.Forest.forest_area,
+        db.Forest.deforestation_rate,
+    )
+
+
+@app.get("/combined", tags=[Tags.combined])
+@conditional_get(*db.FACT_MODELS)
+@response_cache
+async def get_combined(
+    filter_query: Annotated[CombinedParams, Query()],
+    request: Request,
+) -> list[Combined]:
+    columns = select_metrics(filter_query.metric)
+    model = combined_model(tuple(column.key for column in columns))
+    # The table of the first metric decides which countries and years are listed
+    return await list_data(request, filter_query, model, columns[0].class_, *columns)
+
+
+async def aggregate_rows(
+    column: orm.InstrumentedAttribute[float], aggregate_query: AggregateParams
+) -> Sequence[sql.Row]:
+    statement = rollup_statement(column, aggregate_query)
+    if statement is not None:
+        try:
+            return await fetch_all(statement)
+        except sql.exc.ProgrammingError:
+            # The loader has not built the rollups yet
+            pass
+    return await fetch_all(aggregate_statement(column, aggregate_query))
+
+
+def measure_route(
+    path: str,
+    tag: Tags,
+    column: orm.InstrumentedAttribute[float],
+    name: str,
+    endpoint: Callable[..., Awaitable[Response]],
+) -> None:
+    # The name tells the routes apart in the response cache and the schema
+    endpoint.__name__ = endpoint.__qualname__ = f"get_{column.key}_{name}"
+    endpoint = conditional_get(column.class_)(response_cache(endpoint))
+    app.add_api_route(f"/{path}/{name}", endpoint, methods=["GET"], tags=[tag])
+
+
+async def series_response(
+    request: Request, statement: sql.Select, names: list[str]
+) -> Response:
+    rows = await fetch_all(statement)
+    encode = series_encoder(names, str(request.base_url))
+    return Response(
+        pydantic_core.to_json([encode(row) for row in rows]),
+        media_type="application/json",
+    )
+
+
+def measure_routes(
+    path: str, tag: Tags, column: orm.InstrumentedAttribute[float]
+) -> None:
+    async def get_aggregate(
+        aggregate_query: Annotated[AggregateParams, Query()],
+        request: Request,
+    ) -> list[Aggregate]:
+        if memory_store is not None:
+            snapshot = await memory_store.current()
+            rows = snapshot.aggregate(column, aggregate_query)
         else:
-            statement = statement.order_by(db.Forest.country_id)
-        forests = session.execute(statement)
-        forests = [
-            Forest(
-                country=pdt.HttpUrl(f"{request.base_url}countries/{country_id}"),
-                year=year_,
-                forest_area=forest_area,
-                deforestation_rate=deforestation_rate,
-            )
-            for country_id, year_, forest_area, deforestation_rate in forests
+            rows = await aggregate_rows(column, aggregate_query)
+        encode = aggregate_encoder(aggregate_query.group_by, str(request.base_url))
+        return Response(
+            pydantic_core.to_json([encode(row) for row in rows]),
+            media_type="application/json",
+        )
+
+    async def get_rolling(
+        rolling_query: Annotated[RollingParams, Query()],
+        request: Request,
+    ) -> list[RollingMean]:
+        statement = rolling_statement(column, rolling_query)
+        return await series_response(request, statement, ["year", "value"])
+
+    async def get_change(
+        analytics_query: Annotated[AnalyticsParams, Query()],
+        request: Request,
+    ) -> list[Change]:
+        statement = change_statement(column, analytics_query)
+        return await series_response(
+            request, statement, ["year", "value", "change", "relative_change"]
+        )
+
+    async def get_trend(
+        analytics_query: Annotated[AnalyticsParams, Query()],
+        request: Request,
+    ) -> list[Trend]:
+        statement = trend_statement(column, analytics_query)
+        return await series_response(
+            request, statement, ["slope", "intercept", "r2", "count"]
+        )
+
+    async def get_top(
+        top_query: Annotated[TopParams, Query()],
+        request: Request,
+    ) -> list[Ranking]:
+        statement = top_statement(column, top_query)
+        return await series_response(request, statement, ["year", "value", "rank"])
+
+    measure_route(path, tag, column, "aggregate", get_aggregate)
+    measure_route(path, tag, column, "rolling", get_rolling)
+    measure_route(path, tag, column, "change", get_change)
+    measure_route(path, tag, column, "trend", get_trend)
+    measure_route(path, tag, column, "top", get_top)
+
+
+for path, (tag, column) in MEASURES.items():
+    measure_routes(path, tag, column)
+
+
+@app.post("/batch", tags=[Tags.batch])
+async def run_batch(batch: BatchParams, request: Request) -> list[BatchResult]:
+    # One at a time over one connection, so every result sees the same snapshot
+    async with snapshot_transaction():
+        results = [
+            await run_request(request.app, request, path) for path in batch.requests
         ]
-        return forests
+    return Response(encode_results(results), media_type="application/json")
+
+
+@app.get("/metrics/pool", tags=[Tags.metrics])
+async def get_pool_metrics() -> PoolStatus:
+    return pool_metrics.status()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,58 @@
+from fastapi import HTTPException
+import sqlalchemy.orm as orm
+import db
+
+try:  # Production
+    from .tags import Tags
+except ImportError:  # Development
+    from tags import Tags
+
+# Route path of every metric column, following the list routes where they exist
+MEASURES: dict[str, tuple[Tags, orm.InstrumentedAttribute[float]]] = {
+    "temperatures/average": (Tags.temperature, db.Temperature.average_temperature),
+    "temperatures/anomaly": (Tags.temperature, db.Temperature.temperature_anomaly),
+    "population": (Tags.population, db.Population.population),
+    "gdp": (Tags.gdp, db.Population.gdp),
+    "pollution/co2": (Tags.pollution, db.Pollution.co2_emissions),
+    "pollution/methane": (Tags.pollution, db.Pollution.methane_emissions),
+    "pollution/air-pollution-index": (
+        Tags.pollution,
+        db.Pollution.air_pollution_index,
+    ),
+    "pollution/ocean-acidification": (
+        Tags.pollution,
+        db.Pollution.ocean_acidification,
+    ),
+    "pollution/per-capita": (Tags.pollution, db.Pollution.per_capita_emissions),
+    "energy/renewable": (Tags.energy, db.Energy.renewable_energy_usage),
+    "energy/solar-potential": (Tags.energy, db.Energy.solar_energy_potential),
+    "energy/fossil-fuel": (Tags.energy, db.Energy.fossil_fuel_usage),
+    "energy/consumption-per-capita": (
+        Tags.energy,
+        db.Energy.energy_consumption_per_capita,
+    ),
+    "hydrosphere/sea-level-rise": (Tags.hydrosphere, db.Hydrosphere.sea_level_rise),
+    "hydrosphere/arctic-ice-extent": (
+        Tags.hydrosphere,
+        db.Hydrosphere.arctic_ice_extent,
+    ),
+    "rainfall": (Tags.hydrosphere, db.Hydrosphere.average_rainfall),
+    "disasters": (Tags.disaster, db.Disaster.extreme_weather_events),
+    "forests/area": (Tags.forest, db.Forest.forest_area),
+    "forests/deforestation-rate": (Tags.forest, db.Forest.deforestation_rate),
+}
+
+METRICS: dict[str, orm.InstrumentedAttribute[float]] = {
+    column.key: column for _, column in MEASURES.values()
+}
+
+
+def select_metrics(names: list[str]) -> list[orm.InstrumentedAttribute[float]]:
+    unknown = [name for name in names if name not in METRICS]
+    if len(names) == 0 or len(unknown) > 0:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown metrics: {', '.join(unknown)}. "
+            f"Available metrics: {', '.join(METRICS)}",
+        )
+    return [METRICS[name] for name in names]
@@ -1,4 +1,5 @@
-from typing import Annotated
+import functools
+from typing import Annotated, Any
 import pydantic as pdt
 
 try:  # Production
@@ -195,3 +196,108 @@ class Forest(pdt.BaseModel):
         list[Tags | str],
         pdt.Field(frozen=True, exclude=True),
     ] = [Tags.forest]
+
+
+class PoolStatus(pdt.BaseModel):
+    # Counters are per worker process
+    workers: Annotated[int, pdt.Field(ge=1, frozen=True)]
+    size: Annotated[int, pdt.Field(ge=0, frozen=True)]
+    max_overflow: Annotated[int, pdt.Field(frozen=True)]
+    checked_out: Annotated[int, pdt.Field(ge=0, frozen=True)]
+    checked_in: Annotated[int, pdt.Field(ge=0, frozen=True)]
+    overflow: Annotated[int, pdt.Field(ge=0, frozen=True)]
+    checkouts: Annotated[int, pdt.Field(ge=0, frozen=True)]
+    overflow_connections: Annotated[int, pdt.Field(ge=0, frozen=True)]
+    timeouts: Annotated[int, pdt.Field(ge=0, frozen=True)]
+    wait_seconds: Annotated[float, pdt.Field(ge=0, frozen=True)]
+    max_wait_seconds: Annotated[float, pdt.Field(ge=0, frozen=True)]
+    tags: Annotated[
+        list[Tags | str],
+        pdt.Field(frozen=True, exclude=True),
+    ] = [Tags.metrics]
+
+
+class Aggregate(pdt.BaseModel):
+    # Only the key that the rows are grouped by is present
+    year: Annotated[int | None, pdt.Field(default=None, ge=1900, frozen=True)]
+    decade: Annotated[int | None, pdt.Field(default=None, ge=1900, frozen=True)]
+    country: Annotated[pdt.HttpUrl | None, pdt.Field(default=None, frozen=True)]
+    value: Annotated[float | None, pdt.Field(frozen=True)]
+    tags: Annotated[
+        list[Tags | str],
+        pdt.Field(frozen=True, exclude=True),
+    ] = []
+
+
+class Combined(pdt.BaseModel):
+    # Every requested metric is an additional field, null where it is missing
+    model_config = pdt.ConfigDict(extra="allow")
+
+    year: Annotated[int, pdt.Field(ge=1900, frozen=True)]
+    country: Annotated[pdt.HttpUrl, pdt.Field(frozen=True)]
+    tags: Annotated[
+        list[Tags | str],
+        pdt.Field(frozen=True, exclude=True),
+    ] = [Tags.combined]
+
+
+@functools.lru_cache(maxsize=256)
+def combined_model(metrics: tuple[str, ...]) -> type[pdt.BaseModel]:
+    return pdt.create_model(
+        "Combined",
+        year=(int, ...),
+        **{metric: (float | None, None) for metric in metrics},
+        country=(pdt.HttpUrl, ...),
+    )
+
+
+class RollingMean(pdt.BaseModel):
+    year: Annotated[int, pdt.Field(ge=1900, frozen=True)]
+    value: Annotated[float, pdt.Field(frozen=True)]
+    country: Annotated[pdt.HttpUrl, pdt.Field(frozen=True)]
+    tags: Annotated[
+        list[Tags | str],
+        pdt.Field(frozen=True, exclude=True),
+    ] = []
+
+
+class Change(pdt.BaseModel):
+    year: Annotated[int, pdt.Field(ge=1900, frozen=True)]
+    value: Annotated[float, pdt.Field(frozen=True)]
+    change: Annotated[float | None, pdt.Field(frozen=True)]
+    relative_change: Annotated[float | None, pdt.Field(frozen=True)]
+    country: Annotated[pdt.HttpUrl, pdt.Field(frozen=True)]
+    tags: Annotated[
+        list[Tags | str],
+        pdt.Field(frozen=True, exclude=True),
+    ] = []
+
+
+class Trend(pdt.BaseModel):
+    slope: Annotated[float | None, pdt.Field(frozen=True)]
+    intercept: Annotated[float | None, pdt.Field(frozen=True)]
+    r2: Annotated[float | None, pdt.Field(frozen=True)]
+    count: Annotated[int, pdt.Field(ge=0, frozen=True)]
+    country: Annotated[pdt.HttpUrl, pdt.Field(frozen=True)]
+    tags: Annotated[
+        list[Tags | str],
+        pdt.Field(frozen=True, exclude=True),
+    ] = []
+
+
+class Ranking(pdt.BaseModel):
+    year: Annotated[int, pdt.Field(ge=1900, frozen=True)]
+    value: Annotated[float, pdt.Field(frozen=True)]
+    rank: Annotated[int, pdt.Field(ge=1, frozen=True)]
+    country: Annotated[pdt.HttpUrl, pdt.Field(frozen=True)]
+    tags: Annotated[
+        list[Tags | str],
+        pdt.Field(frozen=True, exclude=True),
+    ] = []
+
+
+class BatchResult(pdt.BaseModel):
+    path: Annotated[str, pdt.Field(frozen=True)]
+    status: Annotated[int, pdt.Field(frozen=True)]
+    headers: Annotated[dict[str, str], pdt.Field(frozen=True)]
+    body: Annotated[Any, pdt.Field(frozen=True)]
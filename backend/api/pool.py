@@ -0,0 +1,55 @@
+import threading
+import sqlalchemy as sql
+
+try:  # Production
+    from .model import PoolStatus
+except ImportError:  # Development
+    from model import PoolStatus
+
+
+class PoolMetrics:
+    def __init__(
+        self, pool: sql.pool.QueuePool, max_overflow: int, workers: int
+    ) -> None:
+        self.pool = pool
+        self.max_overflow = max_overflow
+        self.workers = workers
+        self.checkouts = 0
+        self.overflow_connections = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.lock = threading.Lock()
+        sql.event.listen(pool, "connect", self.on_connect)
+
+    def on_connect(self, dbapi_connection, connection_record) -> None:
+        # The overflow counter is raised before the new connection is opened
+        if self.pool.overflow() > 0:
+            with self.lock:
+                self.overflow_connections += 1
+
+    def waited(self, seconds: float) -> None:
+        with self.lock:
+            self.checkouts += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def timed_out(self) -> None:
+        with self.lock:
+            self.timeouts += 1
+
+    def status(self) -> PoolStatus:
+        with self.lock:
+            return PoolStatus(
+                workers=self.workers,
+                size=self.pool.size(),
+                max_overflow=self.max_overflow,
+                checked_out=self.pool.checkedout(),
+                checked_in=self.pool.checkedin(),
+                overflow=max(0, self.pool.overflow()),
+                checkouts=self.checkouts,
+                overflow_connections=self.overflow_connections,
+                timeouts=self.timeouts,
+                wait_seconds=self.wait_seconds,
+                max_wait_seconds=self.max_wait_seconds,
+            )
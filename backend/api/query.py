@@ -0,0 +1,305 @@
+import base64
+import binascii
+import json
+from collections.abc import Sequence
+from fastapi import HTTPException, Request
+import sqlalchemy as sql
+import sqlalchemy.orm as orm
+import db
+
+try:  # Production
+    from .filter import (
+        AggregateParams,
+        AnalyticsParams,
+        FilterParams,
+        PageParams,
+        RollingParams,
+        SliceParams,
+        TopParams,
+    )
+except ImportError:  # Development
+    from filter import (
+        AggregateParams,
+        AnalyticsParams,
+        FilterParams,
+        PageParams,
+        RollingParams,
+        SliceParams,
+        TopParams,
+    )
+
+
+# Key columns are Postgres integers, larger values would fail as bind parameters
+INT_MIN = -(1 << 31)
+INT_MAX = (1 << 31) - 1
+
+
+def encode_cursor(order_by: str, key: Sequence[int | str]) -> str:
+    data = json.dumps([order_by, *key], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_cursor(
+    cursor: str, order_by: str, key_types: Sequence[type]
+) -> list[int | str]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if (
+        not isinstance(data, list)
+        or len(data) != len(key_types) + 1
+        or data[0] != order_by
+        or not all(
+            type(value) is key_type for value, key_type in zip(data[1:], key_types)
+        )
+        or not all(
+            INT_MIN <= value <= INT_MAX for value in data[1:] if type(value) is int
+        )
+    ):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return data[1:]
+
+
+def order_columns(
+    table: type[db.Base], filter_query: FilterParams
+) -> tuple[orm.InstrumentedAttribute[int], orm.InstrumentedAttribute[int]]:
+    if filter_query.order_by == "year":
+        return table.year, table.country_id
+    return table.country_id, table.year
+
+
+def page_statement(
+    statement: sql.Select,
+    key: Sequence[orm.InstrumentedAttribute],
+    page_query: PageParams,
+    order_by: str,
+) -> sql.Select:
+    statement = statement.order_by(None)
+    statement = statement.order_by(*key)
+    if page_query.cursor is not None:
+        values = decode_cursor(
+            page_query.cursor, order_by, [column.type.python_type for column in key]
+        )
+        statement = statement.where(sql.tuple_(*key) > sql.tuple_(*values))
+    if page_query.limit is not None:
+        # One extra row tells whether there is a next page
+        statement = statement.limit(page_query.limit + 1)
+    return statement
+
+
+def slice_conditions(
+    country: sql.ColumnElement[int] | None,
+    year: sql.ColumnElement[int] | None,
+    slice_query: SliceParams,
+) -> list[sql.ColumnElement[bool]]:
+    conditions = []
+    if country is not None and len(slice_query.country) == 1:
+        conditions.append(country == slice_query.country[0])
+    elif country is not None and len(slice_query.country) > 1:
+        conditions.append(country.in_(slice_query.country))
+    if year is None:
+        return conditions
+    if slice_query.year is not None:
+        conditions.append(year == slice_query.year)
+    if slice_query.year_from is not None and slice_query.year_to is not None:
+        conditions.append(year.between(slice_query.year_from, slice_query.year_to))
+    elif slice_query.year_from is not None:
+        conditions.append(year >= slice_query.year_from)
+    elif slice_query.year_to is not None:
+        conditions.append(year <= slice_query.year_to)
+    return conditions
+
+
+def splits_years(slice_query: SliceParams) -> bool:
+    return (
+        slice_query.year is not None
+        or slice_query.year_from is not None
+        or slice_query.year_to is not None
+    )
+
+
+def filter_statement(
+    statement: sql.Select, table: type[db.Base], filter_query: FilterParams
+) -> sql.Select:
+    statement = statement.where(
+        *slice_conditions(table.country_id, table.year, filter_query)
+    )
+    key = order_columns(table, filter_query)
+    return page_statement(statement, key, filter_query, filter_query.order_by)
+
+
+def paginate(
+    request: Request,
+    page_query: PageParams,
+    order_by: str,
+    rows: Sequence[Sequence],
+    key: Sequence[int],
+) -> tuple[Sequence[Sequence], str | None]:
+    # The key holds the positions of the ordering columns within a row
+    if page_query.limit is None or len(rows) <= page_query.limit:
+        return rows, None
+    rows = rows[: page_query.limit]
+    last_row = rows[-1]
+    cursor = encode_cursor(order_by, [last_row[position] for position in key])
+    # Resolved through the route so that the root path is kept
+    next_url = request.url_for(request.scope["route"].name)
+    next_url = next_url.replace(query=request.url.query)
+    next_url = next_url.include_query_params(cursor=cursor)
+    return rows, f'<{next_url}>; rel="next"'
+
+
+def aggregate_statement(
+    column: orm.InstrumentedAttribute[float], aggregate_query: AggregateParams
+) -> sql.Select:
+    table = column.class_.__table__
+    group = db.group_key(table, aggregate_query.group_by)
+    value = db.aggregate_value(aggregate_query.fn, table.c[column.key])
+    statement = sql.select(group, value.label("value"))
+    statement = statement.group_by(group).order_by(group)
+    return statement.where(
+        *slice_conditions(table.c.country_id, table.c.year, aggregate_query)
+    )
+
+
+def rollup_statement(
+    column: orm.InstrumentedAttribute[float], aggregate_query: AggregateParams
+) -> sql.Select | None:
+    # Rollups hold whole groups, so filters that split a group need the fact table
+    group_by = aggregate_query.group_by
+    if group_by != "country" and len(aggregate_query.country) > 0:
+        return None
+    if group_by != "year" and splits_years(aggregate_query):
+        return None
+    rollup = db.ROLLUPS[group_by]
+    if group_by == "country":
+        conditions = slice_conditions(rollup.c.country_id, None, aggregate_query)
+        key = rollup.c.country_id
+    else:
+        key = rollup.c[group_by]
+        conditions = slice_conditions(None, key, aggregate_query)
+    statement = sql.select(key, rollup.c[aggregate_query.fn].label("value"))
+    return statement.where(rollup.c.metric == column.key, *conditions).order_by(key)
+
+
+def year_bounds(
+    year: sql.ColumnElement[int], slice_query: SliceParams
+) -> list[sql.ColumnElement[bool]]:
+    # Windows look back past the first year, so only the last year bounds the input
+    if slice_query.year is not None:
+        return [year <= slice_query.year]
+    if slice_query.year_to is not None:
+        return [year <= slice_query.year_to]
+    return []
+
+
+def rolling_statement(
+    column: orm.InstrumentedAttribute[float], rolling_query: RollingParams
+) -> sql.Select:
+    table = column.class_.__table__
+    value = sql.cast(table.c[column.key], sql.Float)
+    mean = sql.func.avg(value).over(
+        partition_by=table.c.country_id,
+        order_by=table.c.year,
+        # Years, not rows, so missing years shorten the window instead of widening it
+        range_=(-(rolling_query.window - 1), 0),
+    )
+    series = (
+        sql.select(table.c.country_id, table.c.year, mean.label("value"))
+        .where(
+            *slice_conditions(table.c.country_id, None, rolling_query),
+            *year_bounds(table.c.year, rolling_query),
+        )
+        .subquery()
+    )
+    return (
+        sql.select(series.c.country_id, series.c.year, series.c.value)
+        .where(*slice_conditions(None, series.c.year, rolling_query))
+        .order_by(series.c.country_id, series.c.year)
+    )
+
+
+def change_statement(
+    column: orm.InstrumentedAttribute[float], analytics_query: AnalyticsParams
+) -> sql.Select:
+    table = column.class_.__table__
+    value = sql.cast(table.c[column.key], sql.Float)
+    window = dict(partition_by=table.c.country_id, order_by=table.c.year)
+    # Only the directly preceding year counts, gaps in a series give no change
+    previous = sql.case(
+        (
+            sql.func.lag(table.c.year).over(**window) == table.c.year - 1,
+            sql.func.lag(value).over(**window),
+        ),
+    )
+    series = (
+        sql.select(
+            table.c.country_id,
+            table.c.year,
+            value.label("value"),
+            (value - previous).label("change"),
+            ((value - previous) / sql.func.nullif(previous, 0)).label(
+                "relative_change"
+            ),
+        )
+        .where(
+            *slice_conditions(table.c.country_id, None, analytics_query),
+            *year_bounds(table.c.year, analytics_query),
+        )
+        .subquery()
+    )
+    return (
+        sql.select(
+            series.c.country_id,
+            series.c.year,
+            series.c.value,
+            series.c.change,
+            series.c.relative_change,
+        )
+        .where(*slice_conditions(None, series.c.year, analytics_query))
+        .order_by(series.c.country_id, series.c.year)
+    )
+
+
+def trend_statement(
+    column: orm.InstrumentedAttribute[float], analytics_query: AnalyticsParams
+) -> sql.Select:
+    table = column.class_.__table__
+    value = sql.cast(table.c[column.key], sql.Float)
+    year = sql.cast(table.c.year, sql.Float)
+    return (
+        sql.select(
+            table.c.country_id,
+            sql.func.regr_slope(value, year).label("slope"),
+            sql.func.regr_intercept(value, year).label("intercept"),
+            sql.func.regr_r2(value, year).label("r2"),
+            sql.func.regr_count(value, year).label("count"),
+        )
+        .where(*slice_conditions(table.c.country_id, table.c.year, analytics_query))
+        .group_by(table.c.country_id)
+        .order_by(table.c.country_id)
+    )
+
+
+def top_statement(
+    column: orm.InstrumentedAttribute[float], top_query: TopParams
+) -> sql.Select:
+    table = column.class_.__table__
+    value = table.c[column.key]
+    if top_query.year is None:
+        year = sql.select(sql.func.max(table.c.year)).scalar_subquery()
+    else:
+        year = top_query.year
+    order = value.desc() if top_query.order == "desc" else value.asc()
+    # The year and metric index yields the rows in rank order, so the scan stops at n
+    return (
+        sql.select(
+            table.c.country_id,
+            table.c.year,
+            sql.cast(value, sql.Float).label("value"),
+            sql.func.rank().over(order_by=order).label("rank"),
+        )
+        .where(table.c.year == year)
+        .order_by(order, table.c.country_id)
+        .limit(top_query.n)
+    )
@@ -0,0 +1,38 @@
+import os
+
+CACHE_SIZE = int(os.environ.get("DASHBOARD_CACHE_SIZE", 512))
+CACHE_TTL = float(os.environ.get("DASHBOARD_CACHE_TTL", 300))
+CACHE_MAX_BODY_SIZE = int(os.environ.get("DASHBOARD_CACHE_MAX_BODY_SIZE", 8 << 20))
+# Total size of the cached bodies in every worker process
+CACHE_MAX_BYTES = int(os.environ.get("DASHBOARD_CACHE_MAX_BYTES", 64 << 20))
+VERSION_POLL_INTERVAL = float(os.environ.get("DASHBOARD_VERSION_POLL_INTERVAL", 5))
+DATABASE_DRIVER = os.environ.get("DASHBOARD_DATABASE_DRIVER", "asyncpg")
+# Uvicorn reads the same variable for its number of worker processes
+WORKERS = int(os.environ.get("WEB_CONCURRENCY", 1))
+# Connections Postgres can give to the API, shared by all worker processes
+DATABASE_CONNECTIONS = os.environ.get("DASHBOARD_DATABASE_CONNECTIONS")
+if DATABASE_CONNECTIONS is None:
+    POOL_SIZE = int(os.environ.get("DASHBOARD_POOL_SIZE", 5))
+    POOL_MAX_OVERFLOW = int(os.environ.get("DASHBOARD_POOL_MAX_OVERFLOW", 10))
+else:
+    POOL_SIZE = int(
+        os.environ.get(
+            "DASHBOARD_POOL_SIZE", max(1, int(DATABASE_CONNECTIONS) // WORKERS)
+        )
+    )
+    POOL_MAX_OVERFLOW = int(os.environ.get("DASHBOARD_POOL_MAX_OVERFLOW", 0))
+POOL_TIMEOUT = float(os.environ.get("DASHBOARD_POOL_TIMEOUT", 30))
+POOL_RECYCLE = int(os.environ.get("DASHBOARD_POOL_RECYCLE", 1800))
+# Recycling already retires idle connections before Postgres or a proxy drops them
+POOL_PRE_PING = os.environ.get("DASHBOARD_POOL_PRE_PING", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+# Serve the fact tables from memory, reloading them when the dataset changes
+MEMORY_STORE = os.environ.get("DASHBOARD_MEMORY_STORE", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+BATCH_MAX_REQUESTS = int(os.environ.get("DASHBOARD_BATCH_MAX_REQUESTS", 32))
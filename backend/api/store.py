@@ -0,0 +1,199 @@
+import asyncio
+from collections.abc import Hashable, Sequence
+from typing import Any
+from fastapi.concurrency import run_in_threadpool
+import numpy as np
+import sqlalchemy as sql
+import sqlalchemy.orm as orm
+import db
+
+try:  # Production
+    from .database import fetch_all
+    from .filter import AggregateParams, FilterParams, SliceParams
+    from .query import decode_cursor
+    from .version import DatasetVersions
+except ImportError:  # Development
+    from database import fetch_all
+    from filter import AggregateParams, FilterParams, SliceParams
+    from query import decode_cursor
+    from version import DatasetVersions
+
+
+def compound_key(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    # Country ids and years fit in 32 bits, so two of them sort as one integer
+    return (first << 32) | second
+
+
+class TableArrays:
+    def __init__(self, rows: Sequence[sql.Row], names: Sequence[str]) -> None:
+        # Rows arrive ordered by (country_id, year)
+        columns = (
+            list(zip(*rows)) if len(rows) > 0 else [() for _ in range(len(names) + 2)]
+        )
+        self.country_id = np.array(columns[0], dtype=np.int64)
+        self.year = np.array(columns[1], dtype=np.int64)
+        self.values = {
+            name: np.array(values) for name, values in zip(names, columns[2:])
+        }
+        self.country_key = compound_key(self.country_id, self.year)
+        year_key = compound_key(self.year, self.country_id)
+        self.year_order = np.argsort(year_key, kind="stable")
+        self.year_key = year_key[self.year_order]
+
+    def __len__(self) -> int:
+        return len(self.country_id)
+
+    def slice_mask(self, indices: np.ndarray, slice_query: SliceParams) -> np.ndarray:
+        mask = np.ones(len(indices), dtype=bool)
+        if len(slice_query.country) > 0:
+            mask &= np.isin(self.country_id[indices], slice_query.country)
+        year = self.year[indices]
+        if slice_query.year is not None:
+            mask &= year == slice_query.year
+        if slice_query.year_from is not None:
+            mask &= year >= slice_query.year_from
+        if slice_query.year_to is not None:
+            mask &= year <= slice_query.year_to
+        return mask
+
+    def select(self, filter_query: FilterParams) -> np.ndarray:
+        # Offsets into the sorted keys narrow the leading key before anything is masked
+        if filter_query.order_by == "year":
+            keys = self.year_key
+            low = (
+                filter_query.year_from
+                if filter_query.year is None
+                else filter_query.year
+            )
+            high = (
+                filter_query.year_to if filter_query.year is None else filter_query.year
+            )
+        else:
+            keys = self.country_key
+            low = min(filter_query.country, default=None)
+            high = max(filter_query.country, default=None)
+        start = 0 if low is None else np.searchsorted(keys, low << 32)
+        stop = len(keys) if high is None else np.searchsorted(keys, (high + 1) << 32)
+        if filter_query.cursor is not None:
+            first, second = decode_cursor(
+                filter_query.cursor, filter_query.order_by, [int, int]
+            )
+            if second < 0:
+                # Stored keys are never negative, every row of the leading key is after
+                after = np.searchsorted(keys, first << 32)
+            else:
+                after = np.searchsorted(keys, (first << 32) | second, side="right")
+            start = max(start, after)
+        if filter_query.order_by == "year":
+            indices = self.year_order[start:stop]
+        else:
+            indices = np.arange(start, stop)
+        indices = indices[self.slice_mask(indices, filter_query)]
+        if filter_query.limit is not None:
+            # One extra row tells whether there is a next page
+            indices = indices[: filter_query.limit + 1]
+        return indices
+
+    def lookup(self, keys: np.ndarray, name: str) -> list[Any]:
+        # Outer join on (country_id, year), missing rows become None
+        if len(self) == 0:
+            return [None] * len(keys)
+        positions = np.searchsorted(self.country_key, keys)
+        positions = np.minimum(positions, len(self) - 1)
+        values = self.values[name][positions].tolist()
+        for index in np.flatnonzero(self.country_key[positions] != keys):
+            values[index] = None
+        return values
+
+
+class Snapshot:
+    def __init__(
+        self, version: Hashable, tables: dict[type[db.Base], TableArrays]
+    ) -> None:
+        self.version = version
+        self.tables = tables
+
+    def select(
+        self,
+        table: type[db.Base],
+        columns: Sequence[orm.InstrumentedAttribute],
+        filter_query: FilterParams,
+    ) -> list[tuple]:
+        arrays = self.tables[table]
+        indices = arrays.select(filter_query)
+        values = [arrays.country_id[indices].tolist(), arrays.year[indices].tolist()]
+        for column in columns:
+            if column.class_ is table:
+                values.append(arrays.values[column.key][indices].tolist())
+            else:
+                other = self.tables[column.class_]
+                values.append(other.lookup(arrays.country_key[indices], column.key))
+        return list(zip(*values))
+
+    def aggregate(
+        self,
+        column: orm.InstrumentedAttribute[float],
+        aggregate_query: AggregateParams,
+    ) -> list[tuple]:
+        arrays = self.tables[column.class_]
+        if aggregate_query.group_by == "country":
+            indices = np.arange(len(arrays))
+            keys = arrays.country_id
+        else:
+            indices = arrays.year_order
+            keys = arrays.year
+        indices = indices[arrays.slice_mask(indices, aggregate_query)]
+        if len(indices) == 0:
+            return []
+        keys = keys[indices]
+        if aggregate_query.group_by == "decade":
+            keys = keys // 10 * 10
+        values = arrays.values[column.key][indices].astype(np.float64)
+        # Keys are sorted, so every group is a contiguous run
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        counts = np.diff(np.r_[starts, len(keys)])
+        if aggregate_query.fn == "count":
+            results = counts
+        elif aggregate_query.fn == "min":
+            results = np.minimum.reduceat(values, starts)
+        elif aggregate_query.fn == "max":
+            results = np.maximum.reduceat(values, starts)
+        else:
+            results = np.add.reduceat(values, starts)
+            if aggregate_query.fn == "mean":
+                results = results / counts
+        return list(zip(keys[starts].tolist(), results.tolist()))
+
+
+async def load_table(model: type[db.Base]) -> TableArrays:
+    names = [column.name for column in db.metric_columns(model)]
+    table = model.__table__
+    statement = sql.select(
+        table.c.country_id, table.c.year, *(table.c[name] for name in names)
+    ).order_by(table.c.country_id, table.c.year)
+    rows = await fetch_all(statement)
+    return await run_in_threadpool(TableArrays, rows, names)
+
+
+class MemoryStore:
+    def __init__(self, versions: DatasetVersions) -> None:
+        self.versions = versions
+        self.snapshot: Snapshot | None = None
+        self.lock = asyncio.Lock()
+
+    async def load(self, version: Hashable) -> Snapshot:
+        tables = {model: await load_table(model) for model in db.FACT_MODELS}
+        return Snapshot(version, tables)
+
+    async def current(self) -> Snapshot:
+        versions = await self.versions.current()
+        version = tuple(versions.get(model.__tablename__) for model in db.FACT_MODELS)
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        async with self.lock:
+            if self.snapshot is None or self.snapshot.version != version:
+                # Requests wait for the new data rather than answer a new version
+                # with the old one, which the caches would then keep
+                self.snapshot = await self.load(version)
+            return self.snapshot
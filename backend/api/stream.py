@@ -0,0 +1,37 @@
+from collections.abc import AsyncIterable, AsyncIterator, Sequence
+from typing import Any
+from fastapi import Request
+import pydantic_core
+
+try:  # Production
+    from .accept import preferred_quality
+except ImportError:  # Development
+    from accept import preferred_quality
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+STREAM_BATCH_SIZE = 1000
+
+
+def accepts_ndjson(request: Request) -> bool:
+    return preferred_quality(request, NDJSON_MEDIA_TYPE) > 0.0
+
+
+def encode_ndjson(records: Sequence[dict[str, Any]]) -> bytes:
+    return b"".join(pydantic_core.to_json(record) + b"\n" for record in records)
+
+
+async def encode_stream(
+    batches: AsyncIterable[Sequence[dict[str, Any]]], ndjson: bool
+) -> AsyncIterator[bytes]:
+    if ndjson:
+        async for batch in batches:
+            yield encode_ndjson(batch)
+        return
+    # A JSON array with the same shape as the non-streaming response
+    opening = b"["
+    async for batch in batches:
+        if len(batch) == 0:
+            continue
+        yield opening + pydantic_core.to_json(batch)[1:-1]
+        opening = b","
+    yield b"[]" if opening == b"[" else b"]"
@@ -11,3 +11,6 @@ class Tags(StrEnum):
     hydrosphere = "hydrosphere"
     disaster = "disaster"
     forest = "forest"
+    combined = "combined"
+    metrics = "metrics"
+    batch = "batch"
@@ -0,0 +1,44 @@
+import asyncio
+import datetime
+import time
+import sqlalchemy as sql
+import db
+
+try:  # Production
+    from .database import fetch_all
+except ImportError:  # Development
+    from database import fetch_all
+
+
+class DatasetVersions:
+    def __init__(self, poll_interval: float) -> None:
+        self.poll_interval = poll_interval
+        self.versions: dict[str, tuple[int, datetime.datetime]] = {}
+        self.checked_at = float("-inf")
+        self.lock = asyncio.Lock()
+
+    async def read(self) -> dict[str, tuple[int, datetime.datetime]]:
+        statement = sql.select(
+            db.DatasetVersion.table_name,
+            db.DatasetVersion.version,
+            db.DatasetVersion.modified_at,
+        )
+        try:
+            rows = await fetch_all(statement)
+        except sql.exc.ProgrammingError:
+            # The database has not been migrated to track versions yet
+            return {}
+        return {
+            table_name: (version, modified_at)
+            for table_name, version, modified_at in rows
+        }
+
+    async def current(self) -> dict[str, tuple[int, datetime.datetime]]:
+        # The loader runs rarely, so the version is polled instead of read per request
+        if time.monotonic() - self.checked_at < self.poll_interval:
+            return self.versions
+        async with self.lock:
+            if time.monotonic() - self.checked_at >= self.poll_interval:
+                self.versions = await self.read()
+                self.checked_at = time.monotonic()
+        return self.versions
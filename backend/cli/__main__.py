@@ -1,8 +1,8 @@
 import argparse
 import sqlalchemy as sql
-import sqlalchemy.orm as orm
 import db
 from .reset_tables import reset_tables
+from .migrate_tables import migrate_tables
 from .populate_database import populate_database
 
 
@@ -15,7 +15,7 @@ def main() -> None:
         "files",
         action="store",
         type=str,
-        nargs="+",
+        nargs="*",
         metavar="file",
         help="Filenames of csv files containing data following the database's schema.",
     )
@@ -25,16 +25,59 @@ def main() -> None:
         action="store_true",
         help="Reset the database tables.",
     )
+    parser.add_argument(
+        "-m",
+        "--migrate",
+        action="store_true",
+        help="Add missing tables, constraints and indexes to an existing database.",
+    )
+    parser.add_argument(
+        "-u",
+        "--upsert",
+        action="store_true",
+        help="Merge the csv rows into the existing tables, updating rows that "
+        "already exist for the same country and year.",
+    )
+    parser.add_argument(
+        "-c",
+        "--chunk-size",
+        action="store",
+        type=int,
+        default=None,
+        metavar="rows",
+        help="Read csv files in chunks of this many rows to bound memory usage.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        action="store",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Parse files in N worker processes and load the tables of each file "
+        "concurrently, using up to N * 7 database connections.",
+    )
     args = parser.parse_args()
     files: list[str] = args.files
     reset: bool = args.reset
+    migrate: bool = args.migrate
+    upsert: bool = args.upsert
+    if reset and upsert:
+        parser.error("--reset and --upsert cannot be used together")
+    chunk_size: int | None = args.chunk_size
+    if chunk_size is not None and chunk_size <= 0:
+        parser.error("chunk size must be a positive integer")
+    jobs: int = args.jobs
+    if jobs <= 0:
+        parser.error("number of jobs must be a positive integer")
     engine = sql.create_engine(
         f"postgresql+psycopg2://{db.USERNAME}:{db.PASSWORD}@{db.HOST}:{db.PORT}/{db.DATABASE_NAME}"
     )
-    session_factory = orm.sessionmaker(bind=engine)
     if reset:
         reset_tables(engine)
-    populate_database(session_factory, files)
+    elif migrate or upsert:
+        migrate_tables(engine)
+    populate_database(engine, files, chunk_size, jobs, upsert)
 
 
 if __name__ == "__main__":
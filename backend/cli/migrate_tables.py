@@ -0,0 +1,41 @@
+import sqlalchemy as sql
+import db
+from .rollup_views import create_rollups
+
+
+def remove_duplicates(
+    connection: sql.Connection, table: sql.Table, constraint: sql.UniqueConstraint
+) -> None:
+    # Keep the most recently loaded row of every duplicated key
+    duplicate = table.alias("duplicate")
+    statement = sql.delete(table).where(
+        *(
+            table.c[column.name] == duplicate.c[column.name]
+            for column in constraint.columns
+        ),
+        table.c.id < duplicate.c.id,
+    )
+    connection.execute(statement)
+
+
+def migrate_tables(engine: sql.Engine) -> None:
+    db.Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        inspector = sql.inspect(connection)
+        for table in db.Base.metadata.sorted_tables:
+            constraint_names = {
+                constraint["name"]
+                for constraint in inspector.get_unique_constraints(table.name)
+            }
+            index_names = {index["name"] for index in inspector.get_indexes(table.name)}
+            for constraint in table.constraints:
+                if not isinstance(constraint, sql.UniqueConstraint):
+                    continue
+                if constraint.name in constraint_names:
+                    continue
+                remove_duplicates(connection, table, constraint)
+                connection.execute(sql.schema.AddConstraint(constraint))
+            for index in table.indexes:
+                if index.name not in index_names:
+                    index.create(connection)
+        create_rollups(connection)
@@ -1,232 +1,439 @@
-import sqlalchemy.orm as orm
+import io
+import time
+from collections import Counter, defaultdict
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+import sqlalchemy as sql
+import sqlalchemy.dialects.postgresql as postgresql
 import pandas as pd
 import db
+from .rollup_views import refresh_rollups
 
+COLUMNS = [
+    "country",
+    "year",
+    "temperature_anomaly",
+    "co2_emissions",
+    "population",
+    "forest_area",
+    "gdp",
+    "renewable_energy_usage",
+    "methane_emissions",
+    "sea_level_rise",
+    "arctic_ice_extent",
+    "urbanization",
+    "deforestation_rate",
+    "extreme_weather_events",
+    "average_rainfall",
+    "solar_energy_potential",
+    "waste_management",
+    "per_capita_emissions",
+    "industrial_activity",
+    "air_pollution_index",
+    "biodiversity_index",
+    "ocean_acidification",
+    "fossil_fuel_usage",
+    "energy_consumption_per_capita",
+    "policy_score",
+    "average_temperature",
+]
 
-def populate_database(
-    session_factory: orm.sessionmaker[orm.Session], data_files: list[str]
+TABLE_COLUMNS: dict[type[db.Base], list[str]] = {
+    db.Temperature: [
+        "temperature_anomaly",
+        "average_temperature",
+    ],
+    db.Population: [
+        "population",
+        "gdp",
+    ],
+    db.Pollution: [
+        "co2_emissions",
+        "methane_emissions",
+        "air_pollution_index",
+        "ocean_acidification",
+        "per_capita_emissions",
+    ],
+    db.Energy: [
+        "renewable_energy_usage",
+        "solar_energy_potential",
+        "fossil_fuel_usage",
+        "energy_consumption_per_capita",
+    ],
+    db.Hydrosphere: [
+        "sea_level_rise",
+        "arctic_ice_extent",
+        "average_rainfall",
+    ],
+    db.Disaster: [
+        "extreme_weather_events",
+    ],
+    db.Forest: [
+        "forest_area",
+        "deforestation_rate",
+    ],
+}
+
+USED_COLUMNS = [
+    "country",
+    "year",
+    *(column for columns in TABLE_COLUMNS.values() for column in columns),
+]
+
+KEY_COLUMNS = ["country_id", "year"]
+
+INSERT_BATCH_SIZE = 10_000
+
+
+def copy_frame(
+    connection: sql.Connection,
+    table: sql.Table,
+    frame: pd.DataFrame,
+    columns: list[str],
 ) -> None:
-    if len(data_files) == 0:
+    if len(frame) == 0:
         return
-    for file in data_files:
-        file_df = pd.read_csv(
-            file,
-            delimiter=",",
-            header=None,
-            names=[
-                "country",
-                "year",
-                "temperature_anomaly",
-                "co2_emissions",
-                "population",
-                "forest_area",
-                "gdp",
-                "renewable_energy_usage",
-                "methane_emissions",
-                "sea_level_rise",
-                "arctic_ice_extent",
-                "urbanization",
-                "deforestation_rate",
-                "extreme_weather_events",
-                "average_rainfall",
-                "solar_energy_potential",
-                "waste_management",
-                "per_capita_emissions",
-                "industrial_activity",
-                "air_pollution_index",
-                "biodiversity_index",
-                "ocean_acidification",
-                "fossil_fuel_usage",
-                "energy_consumption_per_capita",
-                "policy_score",
-                "average_temperature",
-            ],
-            encoding="utf-8",
-        )
+    if connection.dialect.driver != "psycopg2":
+        # Fallback for drivers without COPY support
+        for start in range(0, len(frame), INSERT_BATCH_SIZE):
+            batch = frame.iloc[start : start + INSERT_BATCH_SIZE]
+            connection.execute(sql.insert(table), batch[columns].to_dict("records"))
+        return
+    preparer = connection.dialect.identifier_preparer
+    statement = "COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(
+        preparer.format_table(table),
+        ", ".join(preparer.quote(column) for column in columns),
+    )
+    buffer = io.StringIO()
+    frame.to_csv(buffer, columns=columns, header=False, index=False)
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(statement, buffer)
+    finally:
+        cursor.close()
 
-        country_df = file_df[["country"]].drop_duplicates(keep="first")
-        country_df.rename(columns={"country": "name"}, inplace=True)
-        country_df.reset_index(drop=True, inplace=True)
-        country_df["id"] = country_df.index
-        with session_factory.begin() as session:
-            countries = [
-                db.Country(id=row["id"], name=row["name"])
-                for _, row in country_df.iterrows()
-            ]
-            session.add_all(countries)
-        country_df.set_index("name", inplace=True)
-
-        temperature_df = file_df[
-            [
-                "country",
-                "year",
-                "temperature_anomaly",
-                "average_temperature",
-            ]
-        ].copy()
-        temperature_df.loc[:, "country"] = temperature_df["country"].map(
-            country_df["id"]
-        )
-        temperature_df.rename(columns={"country": "country_id"}, inplace=True)
-        with session_factory.begin() as session:
-            temperatures = [
-                db.Temperature(
-                    country_id=row["country_id"],
-                    year=row["year"],
-                    temperature_anomaly=row["temperature_anomaly"],
-                    average_temperature=row["average_temperature"],
-                )
-                for _, row in temperature_df.iterrows()
-            ]
-            session.add_all(temperatures)
-        del temperature_df
-
-        population_df = file_df[
-            [
-                "country",
-                "year",
-                "population",
-                "gdp",
-            ]
-        ].copy()
-        population_df.loc[:, "country"] = population_df["country"].map(country_df["id"])
-        population_df.rename(columns={"country": "country_id"}, inplace=True)
-        with session_factory.begin() as session:
-            populations = [
-                db.Population(
-                    country_id=row["country_id"],
-                    year=row["year"],
-                    population=row["population"],
-                    gdp=row["gdp"],
-                )
-                for _, row in population_df.iterrows()
-            ]
-            session.add_all(populations)
-        del population_df
-
-        pollution_df = file_df[
-            [
-                "country",
-                "year",
-                "co2_emissions",
-                "methane_emissions",
-                "air_pollution_index",
-                "ocean_acidification",
-                "per_capita_emissions",
-            ]
-        ].copy()
-        pollution_df.loc[:, "country"] = pollution_df["country"].map(country_df["id"])
-        pollution_df.rename(columns={"country": "country_id"}, inplace=True)
-        with session_factory.begin() as session:
-            pollutions = [
-                db.Pollution(
-                    country_id=row["country_id"],
-                    year=row["year"],
-                    co2_emissions=row["co2_emissions"],
-                    methane_emissions=row["methane_emissions"],
-                    air_pollution_index=row["air_pollution_index"],
-                    ocean_acidification=row["ocean_acidification"],
-                    per_capita_emissions=row["per_capita_emissions"],
-                )
-                for _, row in pollution_df.iterrows()
-            ]
-            session.add_all(pollutions)
-        del pollution_df
-
-        energy_df = file_df[
-            [
-                "country",
-                "year",
-                "renewable_energy_usage",
-                "solar_energy_potential",
-                "fossil_fuel_usage",
-                "energy_consumption_per_capita",
-            ]
-        ].copy()
-        energy_df.loc[:, "country"] = energy_df["country"].map(country_df["id"])
-        energy_df.rename(columns={"country": "country_id"}, inplace=True)
-        with session_factory.begin() as session:
-            energies = [
-                db.Energy(
-                    country_id=row["country_id"],
-                    year=row["year"],
-                    renewable_energy_usage=row["renewable_energy_usage"],
-                    solar_energy_potential=row["solar_energy_potential"],
-                    fossil_fuel_usage=row["fossil_fuel_usage"],
-                    energy_consumption_per_capita=row["energy_consumption_per_capita"],
+
+def upsert_frame(
+    connection: sql.Connection,
+    table: sql.Table,
+    frame: pd.DataFrame,
+    columns: list[str],
+) -> tuple[int, int, int]:
+    staging = sql.Table(
+        f"{table.name}_staging",
+        sql.MetaData(),
+        *(sql.Column(column, table.c[column].type) for column in columns),
+        prefixes=["TEMPORARY"],
+        postgresql_on_commit="DROP",
+    )
+    staging.create(connection)
+    # A key repeated in the csv can only be merged once, the last row wins
+    deduplicated = frame.drop_duplicates(KEY_COLUMNS, keep="last")
+    duplicates = len(frame) - len(deduplicated)
+    frame = deduplicated
+    copy_frame(connection, staging, frame, columns)
+    value_columns = [column for column in columns if column not in KEY_COLUMNS]
+    statement = postgresql.insert(table).from_select(columns, sql.select(*staging.c))
+    statement = statement.on_conflict_do_update(
+        index_elements=KEY_COLUMNS,
+        set_={column: statement.excluded[column] for column in value_columns},
+        where=sql.tuple_(
+            *(table.c[column] for column in value_columns)
+        ).is_distinct_from(
+            sql.tuple_(*(statement.excluded[column] for column in value_columns))
+        ),
+    )
+    # Freshly inserted rows have no deleting transaction yet
+    statement = statement.returning(sql.literal_column("xmax = 0"))
+    changes = connection.execute(statement).scalars().all()
+    inserted = sum(changes)
+    return inserted, len(changes) - inserted, duplicates
+
+
+def bump_versions(engine: sql.Engine, tables: list[str]) -> None:
+    if len(tables) == 0:
+        return
+    statement = postgresql.insert(db.DatasetVersion).values(
+        [{"table_name": table} for table in tables]
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[db.DatasetVersion.table_name],
+        set_={
+            "version": db.DatasetVersion.version + 1,
+            "modified_at": sql.func.now(),
+        },
+    )
+    with engine.begin() as connection:
+        connection.execute(statement)
+
+
+def publish_changes(engine: sql.Engine, tables: list[str]) -> None:
+    if any(model.__tablename__ in tables for model in TABLE_COLUMNS):
+        # Rollups are rebuilt once per load, before a new version can serve stale ones
+        refresh_rollups(engine)
+    bump_versions(engine, tables)
+
+
+class LoadStatistics:
+    def __init__(self) -> None:
+        self.rows: Counter[str] = Counter()
+        self.inserted: Counter[str] = Counter()
+        self.updated: Counter[str] = Counter()
+        self.duplicates: Counter[str] = Counter()
+        self.seconds: defaultdict[str, float] = defaultdict(float)
+
+    def add(
+        self,
+        table: str,
+        rows: int,
+        inserted: int,
+        updated: int,
+        seconds: float,
+        duplicates: int = 0,
+    ) -> None:
+        self.rows[table] += rows
+        self.inserted[table] += inserted
+        self.updated[table] += updated
+        self.duplicates[table] += duplicates
+        self.seconds[table] += seconds
+
+    def changed_tables(self) -> list[str]:
+        return [
+            table
+            for table in self.rows
+            if self.inserted[table] > 0 or self.updated[table] > 0
+        ]
+
+    def report(self) -> None:
+        for table, rows in self.rows.items():
+            seconds = self.seconds[table]
+            rate = rows / seconds if seconds > 0 else float("inf")
+            duplicates = self.duplicates[table]
+            unchanged = rows - self.inserted[table] - self.updated[table] - duplicates
+            print(
+                f"{table}: {rows} rows in {seconds:.2f}s ({rate:.0f} rows/s), "
+                f"{self.inserted[table]} inserted, {self.updated[table]} updated, "
+                f"{unchanged} unchanged"
+                + (f", {duplicates} duplicate keys dropped" if duplicates > 0 else "")
+            )
+
+
+def read_data(
+    file: str, chunk_size: int | None = None, columns: list[str] = USED_COLUMNS
+) -> Iterator[pd.DataFrame]:
+    options = dict(
+        delimiter=",",
+        header=None,
+        names=COLUMNS,
+        usecols=columns,
+        encoding="utf-8",
+    )
+    if chunk_size is None:
+        yield pd.read_csv(file, **options)
+        return
+    with pd.read_csv(file, chunksize=chunk_size, **options) as reader:
+        yield from reader
+
+
+def read_countries(file: str, chunk_size: int | None = None) -> list[str]:
+    names = pd.concat(
+        chunk["country"].drop_duplicates()
+        for chunk in read_data(file, chunk_size, ["country"])
+    )
+    return names.drop_duplicates().tolist()
+
+
+def load_table(
+    engine: sql.Engine,
+    table: sql.Table,
+    frame: pd.DataFrame,
+    columns: list[str],
+    statistics: LoadStatistics,
+    upsert: bool = False,
+) -> None:
+    start = time.perf_counter()
+    with engine.begin() as connection:
+        if upsert:
+            inserted, updated, duplicates = upsert_frame(
+                connection, table, frame, columns
+            )
+        else:
+            copy_frame(connection, table, frame, columns)
+            inserted, updated, duplicates = len(frame), 0, 0
+    statistics.add(
+        table.name,
+        len(frame),
+        inserted,
+        updated,
+        time.perf_counter() - start,
+        duplicates,
+    )
+
+
+class CountryCache:
+    def __init__(self, engine: sql.Engine) -> None:
+        self.engine = engine
+        self.ids: dict[str, int] = {}
+        with engine.begin() as connection:
+            self.read(connection)
+
+    def read(self, connection: sql.Connection) -> None:
+        countries = connection.execute(sql.select(db.Country.name, db.Country.id))
+        self.ids.update(countries.tuples().all())
+
+    def resolve(self, names: pd.Series, statistics: LoadStatistics) -> None:
+        names = names.drop_duplicates()
+        names = names[~names.isin(self.ids.keys())]
+        if len(names) == 0:
+            return
+        table = db.Country.__table__
+        start = time.perf_counter()
+        with self.engine.begin() as connection:
+            # Serialize id assignment with other loaders running at the same time
+            connection.execute(
+                sql.text(
+                    "LOCK TABLE {} IN SHARE ROW EXCLUSIVE MODE".format(
+                        connection.dialect.identifier_preparer.format_table(table)
+                    )
                 )
-                for _, row in energy_df.iterrows()
-            ]
-            session.add_all(energies)
-        del energy_df
-
-        hydrosphere_df = file_df[
-            [
-                "country",
-                "year",
-                "sea_level_rise",
-                "arctic_ice_extent",
-                "average_rainfall",
-            ]
-        ].copy()
-        hydrosphere_df.loc[:, "country"] = hydrosphere_df["country"].map(
-            country_df["id"]
+            )
+            self.read(connection)
+            names = names[~names.isin(self.ids.keys())]
+            first_id = max(self.ids.values(), default=-1) + 1
+            country_df = pd.DataFrame(
+                {
+                    "id": range(first_id, first_id + len(names)),
+                    "name": names.to_numpy(),
+                }
+            )
+            copy_frame(connection, table, country_df, ["id", "name"])
+        statistics.add(
+            table.name,
+            len(country_df),
+            len(country_df),
+            0,
+            time.perf_counter() - start,
         )
-        hydrosphere_df.rename(columns={"country": "country_id"}, inplace=True)
-        with session_factory.begin() as session:
-            hydrospheres = [
-                db.Hydrosphere(
-                    country_id=row["country_id"],
-                    year=row["year"],
-                    sea_level_rise=row["sea_level_rise"],
-                    arctic_ice_extent=row["arctic_ice_extent"],
-                    average_rainfall=row["average_rainfall"],
-                )
-                for _, row in hydrosphere_df.iterrows()
-            ]
-            session.add_all(hydrospheres)
-        del hydrosphere_df
-
-        disaster_df = file_df[
-            [
-                "country",
-                "year",
-                "extreme_weather_events",
-            ]
-        ].copy()
-        disaster_df.loc[:, "country"] = disaster_df["country"].map(country_df["id"])
-        disaster_df.rename(columns={"country": "country_id"}, inplace=True)
-        with session_factory.begin() as session:
-            disasters = [
-                db.Disaster(
-                    country_id=row["country_id"],
-                    year=row["year"],
-                    extreme_weather_events=row["extreme_weather_events"],
-                )
-                for _, row in disaster_df.iterrows()
-            ]
-            session.add_all(disasters)
-        del disaster_df
-
-        forest_df = file_df[
-            [
-                "country",
-                "year",
-                "forest_area",
-                "deforestation_rate",
-            ]
-        ].copy()
-        forest_df.loc[:, "country"] = forest_df["country"].map(country_df["id"])
-        forest_df.rename(columns={"country": "country_id"}, inplace=True)
-        with session_factory.begin() as session:
-            forests = [
-                db.Forest(
-                    country_id=row["country_id"],
-                    year=row["year"],
-                    forest_area=row["forest_area"],
-                    deforestation_rate=row["deforestation_rate"],
-                )
-                for _, row in forest_df.iterrows()
+        self.ids.update(zip(country_df["name"], country_df["id"]))
+
+
+def load_facts(
+    engine: sql.Engine,
+    chunk: pd.DataFrame,
+    country_ids: dict[str, int],
+    statistics: LoadStatistics,
+    upsert: bool = False,
+    executor: ThreadPoolExecutor | None = None,
+) -> None:
+    chunk["country"] = chunk["country"].map(country_ids)
+    chunk.rename(columns={"country": "country_id"}, inplace=True)
+    tasks = [
+        (model.__table__, [*KEY_COLUMNS, *columns])
+        for model, columns in TABLE_COLUMNS.items()
+    ]
+    if executor is None:
+        for table, columns in tasks:
+            load_table(engine, table, chunk, columns, statistics, upsert)
+        return
+    futures = [
+        executor.submit(load_table, engine, table, chunk, columns, statistics, upsert)
+        for table, columns in tasks
+    ]
+    for future in futures:
+        future.result()
+
+
+def load_file(
+    url: str,
+    file: str,
+    chunk_size: int | None,
+    country_ids: dict[str, int],
+    upsert: bool,
+) -> LoadStatistics:
+    # Runs in a worker process, so it needs its own engine and connection pool
+    engine = sql.create_engine(url, pool_size=len(TABLE_COLUMNS), max_overflow=0)
+    statistics = LoadStatistics()
+    try:
+        with ThreadPoolExecutor(max_workers=len(TABLE_COLUMNS)) as executor:
+            for chunk in read_data(file, chunk_size):
+                load_facts(engine, chunk, country_ids, statistics, upsert, executor)
+    finally:
+        engine.dispose()
+    return statistics
+
+
+def populate_database_parallel(
+    engine: sql.Engine,
+    data_files: list[str],
+    chunk_size: int | None,
+    jobs: int,
+    upsert: bool,
+) -> None:
+    url = engine.url.render_as_string(hide_password=False)
+    changed: dict[str, None] = {}
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        try:
+            # Countries are numbered up front so that every worker agrees on the ids
+            names = pd.Series(
+                [
+                    name
+                    for file_names in pool.map(
+                        read_countries, data_files, repeat(chunk_size)
+                    )
+                    for name in file_names
+                ],
+                dtype=object,
+            )
+            countries = CountryCache(engine)
+            statistics = LoadStatistics()
+            countries.resolve(names, statistics)
+            changed.update(dict.fromkeys(statistics.changed_tables()))
+            statistics.report()
+
+            futures = [
+                pool.submit(load_file, url, file, chunk_size, countries.ids, upsert)
+                for file in data_files
             ]
-            session.add_all(forests)
-        del forest_df
+            for file, future in zip(data_files, futures):
+                statistics = future.result()
+                changed.update(dict.fromkeys(statistics.changed_tables()))
+                print(f"{file}:")
+                statistics.report()
+        finally:
+            # Whatever was committed before a failure is published as well
+            publish_changes(engine, list(changed))
+
+
+def populate_database(
+    engine: sql.Engine,
+    data_files: list[str],
+    chunk_size: int | None = None,
+    jobs: int = 1,
+    upsert: bool = False,
+) -> None:
+    if len(data_files) == 0:
+        return
+    # Plain appends skip the migration, so the version table may not exist yet
+    db.DatasetVersion.__table__.create(engine, checkfirst=True)
+    if jobs > 1:
+        populate_database_parallel(engine, data_files, chunk_size, jobs, upsert)
+        return
+    countries = CountryCache(engine)
+    changed: dict[str, None] = {}
+    try:
+        for file in data_files:
+            statistics = LoadStatistics()
+            try:
+                # Every chunk is fanned out to all tables before the next one is read
+                for chunk in read_data(file, chunk_size):
+                    countries.resolve(chunk["country"], statistics)
+                    load_facts(engine, chunk, countries.ids, statistics, upsert)
+            finally:
+                changed.update(dict.fromkeys(statistics.changed_tables()))
+            print(f"{file}:")
+            statistics.report()
+    finally:
+        # Whatever was committed before a failure is published as well
+        publish_changes(engine, list(changed))
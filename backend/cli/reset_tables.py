@@ -1,9 +1,15 @@
 import sqlalchemy as sql
 import db
+from .rollup_views import create_rollups, drop_rollups
 
 
 def reset_tables(engine: sql.Engine) -> None:
+    with engine.begin() as connection:
+        # The views depend on the tables, so they go first
+        drop_rollups(connection)
     metadata = sql.MetaData()
     metadata.reflect(bind=engine)
     metadata.drop_all(bind=engine)
     db.Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        create_rollups(connection)
@@ -0,0 +1,55 @@
+import sqlalchemy as sql
+import db
+
+
+def create_rollups(connection: sql.Connection) -> None:
+    preparer = connection.dialect.identifier_preparer
+    for group_by, rollup in db.ROLLUPS.items():
+        query = db.rollup_select(group_by).compile(
+            dialect=connection.dialect, compile_kwargs={"literal_binds": True}
+        )
+        connection.execute(
+            sql.text(
+                "CREATE MATERIALIZED VIEW IF NOT EXISTS {} AS {}".format(
+                    preparer.format_table(rollup), query
+                )
+            )
+        )
+        # A unique index lets the view be refreshed without blocking readers
+        connection.execute(
+            sql.text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS {} ON {} ({})".format(
+                    preparer.quote(f"ix_{rollup.name}_key"),
+                    preparer.format_table(rollup),
+                    ", ".join(
+                        preparer.quote(column.name) for column in rollup.primary_key
+                    ),
+                )
+            )
+        )
+
+
+def drop_rollups(connection: sql.Connection) -> None:
+    preparer = connection.dialect.identifier_preparer
+    for rollup in db.ROLLUPS.values():
+        connection.execute(
+            sql.text(
+                "DROP MATERIALIZED VIEW IF EXISTS {}".format(
+                    preparer.format_table(rollup)
+                )
+            )
+        )
+
+
+def refresh_rollups(engine: sql.Engine) -> None:
+    with engine.begin() as connection:
+        create_rollups(connection)
+        preparer = connection.dialect.identifier_preparer
+        for rollup in db.ROLLUPS.values():
+            connection.execute(
+                sql.text(
+                    "REFRESH MATERIALIZED VIEW CONCURRENTLY {}".format(
+                        preparer.format_table(rollup)
+                    )
+                )
+            )
@@ -1,2 +1,3 @@
 from .constants import *
 from .model import *
+from .rollup import *
@@ -1,3 +1,4 @@
+import datetime
 import sqlalchemy as sql
 import sqlalchemy.orm as orm
 
@@ -33,6 +34,12 @@ class Country(Base):
 
 class Temperature(Base):
     __tablename__ = "temperature"
+    __table_args__ = (
+        sql.UniqueConstraint(
+            "country_id", "year", name="uq_temperature_country_id_year"
+        ),
+        sql.Index("ix_temperature_year_country_id", "year", "country_id"),
+    )
 
     id: orm.Mapped[int] = orm.mapped_column(
         sql.Integer, primary_key=True, autoincrement=True
@@ -47,6 +54,15 @@ class Temperature(Base):
 
 class Population(Base):
     __tablename__ = "population"
+    __table_args__ = (
+        sql.UniqueConstraint(
+            "country_id", "year", name="uq_population_country_id_year"
+        ),
+        sql.Index("ix_population_year_country_id", "year", "country_id"),
+        # Rankings within a year read these in order
+        sql.Index("ix_population_year_population", "year", "population"),
+        sql.Index("ix_population_year_gdp", "year", "gdp"),
+    )
 
     id: orm.Mapped[int] = orm.mapped_column(
         sql.Integer, primary_key=True, autoincrement=True
@@ -61,6 +77,21 @@ class Population(Base):
 
 class Pollution(Base):
     __tablename__ = "pollution"
+    __table_args__ = (
+        sql.UniqueConstraint("country_id", "year", name="uq_pollution_country_id_year"),
+        sql.Index("ix_pollution_year_country_id", "year", "country_id"),
+        sql.Index("ix_pollution_year_co2_emissions", "year", "co2_emissions"),
+        sql.Index("ix_pollution_year_methane_emissions", "year", "methane_emissions"),
+        sql.Index(
+            "ix_pollution_year_air_pollution_index", "year", "air_pollution_index"
+        ),
+        sql.Index(
+            "ix_pollution_year_ocean_acidification", "year", "ocean_acidification"
+        ),
+        sql.Index(
+            "ix_pollution_year_per_capita_emissions", "year", "per_capita_emissions"
+        ),
+    )
 
     id: orm.Mapped[int] = orm.mapped_column(
         sql.Integer, primary_key=True, autoincrement=True
@@ -78,6 +109,22 @@ class Pollution(Base):
 
 class Energy(Base):
     __tablename__ = "energy"
+    __table_args__ = (
+        sql.UniqueConstraint("country_id", "year", name="uq_energy_country_id_year"),
+        sql.Index("ix_energy_year_country_id", "year", "country_id"),
+        sql.Index(
+            "ix_energy_year_renewable_energy_usage", "year", "renewable_energy_usage"
+        ),
+        sql.Index(
+            "ix_energy_year_solar_energy_potential", "year", "solar_energy_potential"
+        ),
+        sql.Index("ix_energy_year_fossil_fuel_usage", "year", "fossil_fuel_usage"),
+        sql.Index(
+            "ix_energy_year_energy_consumption_per_capita",
+            "year",
+            "energy_consumption_per_capita",
+        ),
+    )
 
     id: orm.Mapped[int] = orm.mapped_column(
         sql.Integer, primary_key=True, autoincrement=True
@@ -94,6 +141,12 @@ class Energy(Base):
 
 class Hydrosphere(Base):
     __tablename__ = "hydrosphere"
+    __table_args__ = (
+        sql.UniqueConstraint(
+            "country_id", "year", name="uq_hydrosphere_country_id_year"
+        ),
+        sql.Index("ix_hydrosphere_year_country_id", "year", "country_id"),
+    )
 
     id: orm.Mapped[int] = orm.mapped_column(
         sql.Integer, primary_key=True, autoincrement=True
@@ -109,6 +162,10 @@ class Hydrosphere(Base):
 
 class Disaster(Base):
     __tablename__ = "disaster"
+    __table_args__ = (
+        sql.UniqueConstraint("country_id", "year", name="uq_disaster_country_id_year"),
+        sql.Index("ix_disaster_year_country_id", "year", "country_id"),
+    )
 
     id: orm.Mapped[int] = orm.mapped_column(
         sql.Integer, primary_key=True, autoincrement=True
@@ -122,6 +179,12 @@ class Disaster(Base):
 
 class Forest(Base):
     __tablename__ = "forest"
+    __table_args__ = (
+        sql.UniqueConstraint("country_id", "year", name="uq_forest_country_id_year"),
+        sql.Index("ix_forest_year_country_id", "year", "country_id"),
+        sql.Index("ix_forest_year_forest_area", "year", "forest_area"),
+        sql.Index("ix_forest_year_deforestation_rate", "year", "deforestation_rate"),
+    )
 
     id: orm.Mapped[int] = orm.mapped_column(
         sql.Integer, primary_key=True, autoincrement=True
@@ -132,3 +195,13 @@ class Forest(Base):
     deforestation_rate: orm.Mapped[float]
 
     country: orm.Mapped[Country] = orm.relationship(back_populates="forests")
+
+
+class DatasetVersion(Base):
+    __tablename__ = "dataset_version"
+
+    table_name: orm.Mapped[str] = orm.mapped_column(sql.String(32), primary_key=True)
+    version: orm.Mapped[int] = orm.mapped_column(default=1)
+    modified_at: orm.Mapped[datetime.datetime] = orm.mapped_column(
+        sql.DateTime(timezone=True), server_default=sql.func.now()
+    )
@@ -0,0 +1,96 @@
+import sqlalchemy as sql
+from .model import (
+    Base,
+    Temperature,
+    Population,
+    Pollution,
+    Energy,
+    Hydrosphere,
+    Disaster,
+    Forest,
+)
+
+FACT_MODELS: list[type[Base]] = [
+    Temperature,
+    Population,
+    Pollution,
+    Energy,
+    Hydrosphere,
+    Disaster,
+    Forest,
+]
+
+ROLLUP_FUNCTIONS = {
+    "mean": sql.func.avg,
+    "sum": sql.func.sum,
+    "min": sql.func.min,
+    "max": sql.func.max,
+    "count": sql.func.count,
+}
+
+# Materialized views are kept out of Base.metadata so create_all leaves them alone
+rollup_metadata = sql.MetaData()
+
+
+def metric_columns(model: type[Base]) -> list[sql.Column]:
+    return [
+        column
+        for column in model.__table__.columns
+        if column.name not in ("id", "country_id", "year")
+    ]
+
+
+def group_key(table: sql.Table, group_by: str) -> sql.ColumnElement[int]:
+    if group_by == "country":
+        return table.c.country_id
+    if group_by == "decade":
+        # Integer division rounds every year down to the start of its decade
+        return (table.c.year // 10 * 10).label("decade")
+    return table.c.year
+
+
+def aggregate_value(function: str, column: sql.ColumnElement) -> sql.ColumnElement:
+    value = ROLLUP_FUNCTIONS[function](column)
+    if function == "count":
+        return value
+    # Averages of integer columns would otherwise come back as numeric
+    return sql.cast(value, sql.Float)
+
+
+def rollup_select(group_by: str) -> sql.CompoundSelect:
+    selects = []
+    for model in FACT_MODELS:
+        table = model.__table__
+        key = group_key(table, group_by)
+        for column in metric_columns(model):
+            selects.append(
+                sql.select(
+                    sql.literal(column.name, sql.String(32)).label("metric"),
+                    key,
+                    *(
+                        aggregate_value(function, column).label(function)
+                        for function in ROLLUP_FUNCTIONS
+                    ),
+                ).group_by(key)
+            )
+    return sql.union_all(*selects)
+
+
+def rollup_table(group_by: str, key: str) -> sql.Table:
+    return sql.Table(
+        f"rollup_{group_by}",
+        rollup_metadata,
+        sql.Column("metric", sql.String(32), primary_key=True),
+        sql.Column(key, sql.Integer, primary_key=True),
+        *(
+            sql.Column(function, sql.BigInteger if function == "count" else sql.Float)
+            for function in ROLLUP_FUNCTIONS
+        ),
+    )
+
+
+ROLLUPS: dict[str, sql.Table] = {
+    "year": rollup_table("year", "year"),
+    "country": rollup_table("country", "country_id"),
+    "decade": rollup_table("decade", "decade"),
+}
@@ -0,0 +1,58 @@
+import pytest
+from fastapi import Request
+from api.columnar import ARROW_MEDIA_TYPE, PARQUET_MEDIA_TYPE, accepts_columnar
+from api.stream import accepts_ndjson
+
+
+def request(accept: str | None) -> Request:
+    headers = [] if accept is None else [(b"accept", accept.encode())]
+    return Request({"type": "http", "headers": headers})
+
+
+@pytest.mark.parametrize(
+    "accept, expected",
+    [
+        (None, False),
+        ("*/*", False),
+        ("application/*", False),
+        ("text/html,application/xhtml+xml,*/*;q=0.8", False),
+        ("application/x-ndjson", True),
+        ("Application/X-NDJSON", True),
+        ("application/x-ndjson;q=0", False),
+        ("application/x-ndjson; q=0.0", False),
+        ("application/x-ndjson;q=bad", False),
+        ("application/x-ndjson;q=0.5, application/json", False),
+        ("application/json;q=0.5, application/x-ndjson", True),
+        ("application/x-ndjson, application/json", True),
+        ("application/x-ndjson;q=0.5, */*;q=0.1", True),
+        ("application/json;q=0, application/x-ndjson;q=0.1", True),
+    ],
+)
+def test_accepts_ndjson(accept: str | None, expected: bool) -> None:
+    assert accepts_ndjson(request(accept)) is expected
+
+
+@pytest.mark.parametrize(
+    "accept, expected",
+    [
+        (None, None),
+        ("*/*", None),
+        ("application/vnd.apache.arrow.stream", ARROW_MEDIA_TYPE),
+        ("application/vnd.apache.parquet", PARQUET_MEDIA_TYPE),
+        ("application/vnd.apache.arrow.stream;q=0", None),
+        ("application/vnd.apache.arrow.stream;q=0, application/json", None),
+        (
+            "application/vnd.apache.parquet, application/vnd.apache.arrow.stream",
+            ARROW_MEDIA_TYPE,
+        ),
+        (
+            "application/vnd.apache.parquet, application/vnd.apache.arrow.stream;q=0.9",
+            PARQUET_MEDIA_TYPE,
+        ),
+        ("application/json, application/vnd.apache.parquet;q=0.5", None),
+        ("application/x-ndjson, application/vnd.apache.arrow.stream", ARROW_MEDIA_TYPE),
+        ("application/x-ndjson, application/vnd.apache.arrow.stream;q=0.5", None),
+    ],
+)
+def test_accepts_columnar(accept: str | None, expected: str | None) -> None:
+    assert accepts_columnar(request(accept)) == expected
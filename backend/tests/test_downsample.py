@@ -0,0 +1,74 @@
+import math
+import pytest
+from api.downsample import downsample, largest_triangle_three_buckets
+
+
+def series(country_id: int, values: list[float | None], first_year: int = 1990):
+    return [
+        (country_id, first_year + offset, value) for offset, value in enumerate(values)
+    ]
+
+
+@pytest.mark.parametrize("size, threshold", [(0, 3), (1, 3), (5, 5), (5, 10), (8, 2)])
+def test_short_series_are_kept_whole(size: int, threshold: int) -> None:
+    x = list(range(size))
+    assert largest_triangle_three_buckets(x, x, threshold) == list(range(size))
+
+
+@pytest.mark.parametrize("size", [10, 57, 200])
+@pytest.mark.parametrize("threshold", [3, 4, 9])
+def test_selection_keeps_the_ends_in_order(size: int, threshold: int) -> None:
+    x = list(range(size))
+    y = [math.sin(value / 3) for value in x]
+    selected = largest_triangle_three_buckets(x, y, threshold)
+    assert len(selected) == threshold
+    assert selected[0] == 0 and selected[-1] == size - 1
+    assert selected == sorted(set(selected))
+
+
+@pytest.mark.parametrize("peak", [1, 13, 25, 38])
+def test_selection_keeps_a_spike(peak: int) -> None:
+    y = [1.0] * 40
+    y[peak] = 100.0
+    assert peak in largest_triangle_three_buckets(list(range(40)), y, 6)
+
+
+def test_every_bucket_contributes_one_point() -> None:
+    # Inner buckets are [1, 2], [3, 4] and [5, 6]. In the middle one the drop to
+    # zero at 3 spans a larger triangle (21.5) than the peak at 4 (10.5)
+    selected = largest_triangle_three_buckets(
+        list(range(8)), [0, 5, 0, 0, 7, 0, 9, 0], 5
+    )
+    assert selected == [0, 1, 3, 6, 7]
+
+
+def test_countries_are_downsampled_separately() -> None:
+    rows = series(1, [float(value % 7) for value in range(30)]) + series(
+        2, [1.0, 2.0, 3.0]
+    )
+    result = downsample(rows, 5, 2)
+    assert [row for row in result if row[0] == 2] == series(2, [1.0, 2.0, 3.0])
+    first = [row for row in result if row[0] == 1]
+    assert len(first) == 5
+    assert first[0] == rows[0] and first[-1] == rows[29]
+    # Rows come back in their original order
+    assert result == [row for row in rows if row in result]
+
+
+def test_missing_values_are_not_read_as_zeros() -> None:
+    values = [100.0 + (offset % 3) for offset in range(30)]
+    for gap in (4, 11, 17, 23):
+        values[gap] = None
+    values[20] = 150.0
+    result = downsample(series(1, values), 6, 2)
+    assert all(row[2] is not None for row in result)
+    assert (1, 2010, 150.0) in result
+    assert len(result) == 6
+
+
+def test_series_without_values_are_spread_over_the_years() -> None:
+    rows = series(1, [None] * 20)
+    assert downsample(rows, 4, 2) == downsample(rows, 4, None)
+    result = downsample(rows, 4, None)
+    assert len(result) == 4
+    assert result[0] == rows[0] and result[-1] == rows[-1]
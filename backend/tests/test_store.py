@@ -0,0 +1,219 @@
+import random
+from collections import defaultdict
+import numpy as np
+import pytest
+import db
+from api.filter import AggregateParams, FilterParams
+from api.query import encode_cursor
+from api.store import Snapshot, TableArrays, compound_key
+
+# Large enough that a bad shift would mix country ids into the years
+COUNTRIES = [0, 1, 2, 5, 9, 70_000]
+YEARS = range(1990, 2010)
+
+
+def make_rows(seed: int, keep: float) -> list[tuple]:
+    generator = random.Random(seed)
+    return [
+        (country_id, year, generator.uniform(-100, 100), generator.randint(0, 50))
+        for country_id in COUNTRIES
+        for year in YEARS
+        if generator.random() < keep
+    ]
+
+
+POPULATION_ROWS = make_rows(1, 0.8)
+# Fewer rows, so that joined columns have gaps
+TEMPERATURE_ROWS = make_rows(2, 0.5)
+
+
+@pytest.fixture(scope="module")
+def snapshot() -> Snapshot:
+    return Snapshot(
+        (1,),
+        {
+            db.Population: TableArrays(POPULATION_ROWS, ["population", "gdp"]),
+            db.Temperature: TableArrays(
+                TEMPERATURE_ROWS, ["temperature_anomaly", "average_temperature"]
+            ),
+        },
+    )
+
+
+def matches(row: tuple, query: FilterParams | AggregateParams) -> bool:
+    country_id, year = row[0], row[1]
+    return (
+        (len(query.country) == 0 or country_id in query.country)
+        and (query.year is None or year == query.year)
+        and (query.year_from is None or year >= query.year_from)
+        and (query.year_to is None or year <= query.year_to)
+    )
+
+
+def sort_key(order_by: str, row: tuple) -> tuple[int, int]:
+    return (row[1], row[0]) if order_by == "year" else (row[0], row[1])
+
+
+def expected_rows(filter_query: FilterParams) -> list[tuple]:
+    temperatures = {row[:2]: row[3] for row in TEMPERATURE_ROWS}
+    rows = [
+        (*row[:3], temperatures.get(row[:2]))
+        for row in POPULATION_ROWS
+        if matches(row, filter_query)
+    ]
+    return sorted(rows, key=lambda row: sort_key(filter_query.order_by, row))
+
+
+def select(snapshot: Snapshot, **parameters) -> list[tuple]:
+    return snapshot.select(
+        db.Population,
+        [db.Population.population, db.Temperature.average_temperature],
+        FilterParams(**parameters),
+    )
+
+
+SLICES = [
+    {},
+    {"country": [2]},
+    {"country": [1, 9]},
+    {"country": [0, 70_000]},
+    {"country": [3]},
+    {"year": 1995},
+    {"year": 1989},
+    {"year_from": 2000},
+    {"year_to": 1993},
+    {"year_from": 1994, "year_to": 1997},
+    {"country": [1, 5], "year_from": 1998, "year_to": 2003},
+    {"country": [70_000], "year": 2009},
+]
+
+
+@pytest.mark.parametrize("order_by", ["year", "country"])
+@pytest.mark.parametrize("slice_query", SLICES)
+def test_select_matches_a_full_scan(
+    snapshot: Snapshot, order_by: str, slice_query: dict
+) -> None:
+    filter_query = FilterParams(order_by=order_by, **slice_query)
+    assert select(snapshot, order_by=order_by, **slice_query) == expected_rows(
+        filter_query
+    )
+
+
+@pytest.mark.parametrize("order_by", ["year", "country"])
+@pytest.mark.parametrize("slice_query", SLICES)
+@pytest.mark.parametrize("limit", [1, 7])
+def test_cursor_pages_cover_every_row_once(
+    snapshot: Snapshot, order_by: str, slice_query: dict, limit: int
+) -> None:
+    rows = []
+    cursor = None
+    # A cursor that does not move forward would otherwise page forever
+    for _ in range(len(POPULATION_ROWS) + 1):
+        page = select(
+            snapshot, order_by=order_by, limit=limit, cursor=cursor, **slice_query
+        )
+        # One row past the limit tells that there is a next page
+        assert len(page) <= limit + 1
+        rows.extend(page[:limit])
+        if len(page) <= limit:
+            break
+        cursor = encode_cursor(order_by, sort_key(order_by, page[limit - 1]))
+    else:
+        pytest.fail("pages never ended")
+    filter_query = FilterParams(order_by=order_by, **slice_query)
+    assert rows == expected_rows(filter_query)
+
+
+@pytest.mark.parametrize("order_by", ["year", "country"])
+def test_cursor_after_the_last_row_is_empty(snapshot: Snapshot, order_by: str) -> None:
+    last = expected_rows(FilterParams(order_by=order_by))[-1]
+    cursor = encode_cursor(order_by, sort_key(order_by, last))
+    assert select(snapshot, order_by=order_by, cursor=cursor) == []
+
+
+def test_cursor_between_rows_resumes_at_the_next_one(snapshot: Snapshot) -> None:
+    # No row has this key, the page starts right after where it would be
+    cursor = encode_cursor("country", [4, 2000])
+    assert select(snapshot, order_by="country", limit=1, cursor=cursor)[0][0] == 5
+
+
+@pytest.mark.parametrize("order_by", ["year", "country"])
+@pytest.mark.parametrize(
+    "key", [[2000, -1], [-1, 5], [-1, -1], [1995, -(1 << 31)], [-(1 << 31), 0]]
+)
+def test_cursor_with_negative_keys_resumes_after_them(
+    snapshot: Snapshot, order_by: str, key: list[int]
+) -> None:
+    cursor = encode_cursor(order_by, key)
+    expected = [
+        row
+        for row in expected_rows(FilterParams(order_by=order_by))
+        if sort_key(order_by, row) > tuple(key)
+    ]
+    assert select(snapshot, order_by=order_by, cursor=cursor) == expected
+
+
+def test_lookup_fills_missing_rows_with_none() -> None:
+    arrays = TableArrays([(1, 2000, 1.5), (1, 2002, 2.5), (3, 2000, 3.5)], ["value"])
+    keys = compound_key(
+        np.array([0, 1, 1, 1, 3, 4]), np.array([2000, 2000, 2001, 2002, 2000, 1999])
+    )
+    assert arrays.lookup(keys, "value") == [None, 1.5, None, 2.5, 3.5, None]
+
+
+def test_empty_table() -> None:
+    arrays = TableArrays([], ["value"])
+    assert len(arrays) == 0
+    assert arrays.select(FilterParams(order_by="country")).tolist() == []
+    assert arrays.select(FilterParams(order_by="year", limit=5)).tolist() == []
+    assert arrays.lookup([1 << 32], "value") == [None]
+
+
+def expected_aggregate(
+    column: int, aggregate_query: AggregateParams
+) -> list[tuple[int, float]]:
+    groups = defaultdict(list)
+    for row in POPULATION_ROWS:
+        if not matches(row, aggregate_query):
+            continue
+        if aggregate_query.group_by == "country":
+            key = row[0]
+        elif aggregate_query.group_by == "decade":
+            key = row[1] // 10 * 10
+        else:
+            key = row[1]
+        groups[key].append(float(row[column]))
+    functions = {
+        "mean": lambda values: sum(values) / len(values),
+        "sum": sum,
+        "min": min,
+        "max": max,
+        "count": len,
+    }
+    return [
+        (key, functions[aggregate_query.fn](values))
+        for key, values in sorted(groups.items())
+    ]
+
+
+@pytest.mark.parametrize("group_by", ["year", "country", "decade"])
+@pytest.mark.parametrize("fn", ["mean", "sum", "min", "max", "count"])
+@pytest.mark.parametrize("slice_query", SLICES)
+@pytest.mark.parametrize(
+    "column, position", [(db.Population.population, 2), (db.Population.gdp, 3)]
+)
+def test_aggregate_matches_a_full_scan(
+    snapshot: Snapshot,
+    group_by: str,
+    fn: str,
+    slice_query: dict,
+    column,
+    position: int,
+) -> None:
+    aggregate_query = AggregateParams(group_by=group_by, fn=fn, **slice_query)
+    result = snapshot.aggregate(column, aggregate_query)
+    expected = expected_aggregate(position, aggregate_query)
+    assert [key for key, _ in result] == [key for key, _ in expected]
+    assert [value for _, value in result] == pytest.approx(
+        [value for _, value in expected]
+    )